@@ -1,6 +1,166 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from functools import partial
+from heapq import merge
+from itertools import islice
+from operator import itemgetter
+import sys
 import matplotlib.pyplot as plt
 import networkx as nx
 
+_END = object()
+
+
+class PostingList(list):
+    """The values stored under one key of a tree that stores values, once the key has more than one.
+    A key with a single value stores the value itself, so unique keys cost no extra list.
+    """
+    __slots__ = ()
+
+
+def _common_prefix_length(a, b):
+    """Returns the length of the longest common prefix of two strings."""
+    length = min(len(a), len(b))
+    for i in range(length):
+        if a[i] != b[i]:
+            return i
+    return length
+
+
+class PrefixKeys:
+    """The sorted string keys of a leaf, stored as their common prefix and the remaining suffixes.
+    It acts as the list of full keys for everything the tree does with leaf keys (indexing, slicing,
+    binary search, insert, pop and del), rebuilding a key from the prefix when it is read.
+    """
+    __slots__ = ('prefix', 'suffixes')
+
+    def __init__(self, keys=()):
+        keys = list(keys)
+        self.prefix = keys[0][:_common_prefix_length(keys[0], keys[-1])] if keys else None
+        start = len(self.prefix) if keys else 0
+        self.suffixes = [key[start:] for key in keys]
+
+    def __len__(self):
+        return len(self.suffixes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            part = PrefixKeys()
+            part.prefix = self.prefix
+            part.suffixes = self.suffixes[index]
+            part._tighten()
+            return part
+        return self.prefix + self.suffixes[index]
+
+    def __iter__(self):
+        return map(self.prefix.__add__, self.suffixes) if self.suffixes else iter(())
+
+    def __reversed__(self):
+        return map(self.prefix.__add__, reversed(self.suffixes)) if self.suffixes else iter(())
+
+    def __delitem__(self, index):
+        del self.suffixes[index]
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def insert(self, index, key):
+        self._admit(key)
+        self.suffixes.insert(index, key[len(self.prefix):])
+
+    def append(self, key):
+        self._admit(key)
+        self.suffixes.append(key[len(self.prefix):])
+
+    def extend(self, keys):
+        for key in keys:
+            self.append(key)
+
+    def pop(self, index=-1):
+        return self.prefix + self.suffixes.pop(index)
+
+    def _admit(self, key):
+        """Shortens the prefix, and lengthens every suffix, until the prefix also starts key."""
+        if not self.suffixes:
+            self.prefix = key
+        elif not key.startswith(self.prefix):
+            length = _common_prefix_length(self.prefix, key)
+            cut = self.prefix[length:]
+            self.suffixes = [cut + suffix for suffix in self.suffixes]
+            self.prefix = self.prefix[:length]
+
+    def _tighten(self):
+        """Moves the part that all suffixes share into the prefix, e.g. after a leaf was split."""
+        if self.suffixes:
+            length = _common_prefix_length(self.suffixes[0], self.suffixes[-1])
+            if length:
+                self.prefix += self.suffixes[0][:length]
+                self.suffixes = [suffix[length:] for suffix in self.suffixes]
+
+
+class OperationCounters:
+    """Work counters of an instrumented tree, kept separately for every public operation.
+    Events are charged to the innermost operation running, so the inserts issued by
+    `build_tree` show up under insert.
+    """
+    EVENTS = ('node_visits', 'key_comparisons', 'leaf_hops', 'splits', 'borrows', 'merges')
+
+    def __init__(self):
+        self.totals = {}
+        self._running = []
+
+    def _counts(self, operation):
+        counts = self.totals.get(operation)
+        if counts is None:
+            counts = self.totals[operation] = dict.fromkeys(('calls',) + self.EVENTS, 0)
+        return counts
+
+    @contextmanager
+    def operation(self, operation):
+        """Charges the events recorded while the block runs to one call of an operation."""
+        counts = self._counts(operation)
+        counts['calls'] += 1
+        self._running.append(counts)
+        try:
+            yield
+        finally:
+            self._running.pop()
+
+    def iterate(self, operation, iterator):
+        """Charges the work done while producing each item of a lazy iterator to an operation."""
+        counts = self._counts(operation)
+        while True:
+            self._running.append(counts)
+            try:
+                item = next(iterator, _END)
+            finally:
+                self._running.pop()
+            if item is _END:
+                return
+            yield item
+
+    def record(self, event, amount=1):
+        """Adds to an event counter of the running operation."""
+        counts = self._running[-1] if self._running else self._counts('other')
+        counts[event] += amount
+
+    def reset(self):
+        self.totals.clear()
+
+    def summary(self):
+        """Returns the totals of every operation together with their averages per call.
+        :return: A dict mapping operation names to dicts of totals, with a 'per_call' dict.
+        """
+        summary = {}
+        for operation, counts in self.totals.items():
+            row = dict(counts)
+            calls = counts['calls']
+            row['per_call'] = {event: counts[event] / calls for event in self.EVENTS} if calls else {}
+            summary[operation] = row
+        return summary
+
+
 class BPlusTree:
     class Node:
         """Initialize a new node which can be either a leaf or an internal node.
@@ -17,35 +177,339 @@ class BPlusTree:
             super().__init__(True)
             self.next = None
 
-    def __init__(self, order):
+    class CompactNode:
+        """Internal node of a compact tree: no per-instance __dict__ and keys held in a typed array.
+            :param typecode: The array typecode of the keys, e.g. 'q' for 64-bit integers.
+        """
+        __slots__ = ('keys', 'children')
+        is_leaf = False
+
+        def __init__(self, typecode='q'):
+            self.keys = array(typecode)
+            self.children = []
+
+    class CompactLeafNode:
+        """Leaf node of a compact tree. Leaves never have children, so they share an empty tuple."""
+        __slots__ = ('keys', 'next', 'values')
+        is_leaf = True
+        children = ()
+
+        def __init__(self, typecode='q'):
+            self.keys = array(typecode)
+            self.next = None
+
+    with_values = False
+    compress_keys = False
+
+    def __init__(self, order, compact=False, key_type='q', with_values=False, compress_keys=False):
         """Create a new empty B+ tree with a given order.
         :param order: The maximum number of children a node can have.
+        :param compact: Use slotted nodes with typed key arrays, for numeric keys only (default False).
+        :param key_type: The array typecode of the keys in compact mode, 'q' for int64 or 'd' for float64.
+        :param with_values: Store values under the keys, see `put` (default False). Leaves then
+                            hold every key once, next to its value or its PostingList of values.
+        :param compress_keys: For string keys: separators keep only the shortest prefix that still
+                              separates two leaves, and leaves store the common prefix of their keys
+                              once (default False).
         """
+        if compact and compress_keys:
+            raise ValueError("compress_keys is for string keys and cannot be combined with compact")
         self.root = None
         self.order = order
+        self.compact = compact
+        self.key_type = key_type
+        self.with_values = with_values
+        self.compress_keys = compress_keys
+        if compact:
+            self.Node = partial(self.CompactNode, key_type)
+            self.LeafNode = partial(self.CompactLeafNode, key_type)
+        if compress_keys:
+            self.LeafNode = partial(self._prefix_leaf, self.LeafNode)
+        if with_values:
+            self.LeafNode = partial(self._value_leaf, self.LeafNode)
 
-    def build_tree(self, collection, dense=True):
+    @staticmethod
+    def _prefix_leaf(make_leaf):
+        """Creates a leaf that keeps its keys in PrefixKeys."""
+        leaf = make_leaf()
+        leaf.keys = PrefixKeys()
+        return leaf
+
+    @staticmethod
+    def _value_leaf(make_leaf):
+        """Creates a leaf with a `values` list running parallel to its keys."""
+        leaf = make_leaf()
+        leaf.values = []
+        return leaf
+
+    # Instrumentation replaces these hooks and operations by counting versions on the instance,
+    # so an uninstrumented tree runs the plain methods without any extra check.
+    counters = None
+    _COUNTED_HOOKS = ('_find_path', '_find_node', '_find_leaf', '_find_key_path', '_leftmost_leaf', '_next_leaf',
+                      '_writable_child', '_split', '_shift_left', '_shift_right', '_merge')
+    _COUNTED_OPERATIONS = ('insert', 'delete', 'search', 'range_search', 'cursor', 'search_many',
+                           'range_search_many', 'delete_range', 'delete_many', 'bulk_load',
+                           'put', 'get', 'items', 'remove')
+
+    def build_tree(self, collection, dense=True, bulk=False, presorted=False, fill_factor=None):
         """Builds a B+ tree from a collection of values.
-        :param collection: A list of values to insert into the tree.
+        :param collection: A list of values to insert into the tree, or of (key, value) pairs
+                           for a tree that stores values.
         :param dense: A boolean indicating if the tree should be densely packed (default True).
+        :param bulk: Build the tree bottom-up with `bulk_load` instead of inserting one value at a time.
+        :param presorted: Only used with bulk, skips sorting when the collection is already sorted.
+        :param fill_factor: Only used with bulk, see `bulk_load`.
         """
+        if bulk:
+            self.bulk_load(collection, dense, presorted, fill_factor)
+            return
+        if self.with_values:
+            for key, value in collection:
+                self.put(key, value, dense)
+            return
         for value in collection:
             self.insert(value, dense)
 
+    def bulk_load(self, collection, dense=True, presorted=False, fill_factor=None):
+        """Builds the tree bottom-up from a collection of values in a single pass.
+        Leaves are packed left to right and linked through `next`, then each internal level
+        is built over the level below it. Keys already in the tree are merged in.
+        :param collection: The values to load, or (key, value) pairs for a tree that stores values.
+        :param dense: Dense trees fill nodes completely, sparse trees fill them to the minimum
+                      occupancy that deletes maintain (default True).
+        :param presorted: Set when the collection is already in ascending key order (default False).
+        :param fill_factor: Fraction of a node's capacity to fill, overriding dense (0 < f <= 1).
+        """
+        if fill_factor is None:
+            fill_factor = 1.0 if dense else 0.5
+        if not 0 < fill_factor <= 1:
+            raise ValueError(f"fill_factor {fill_factor} must be in (0, 1]")
+
+        if self.with_values:
+            keys, values = self._group_values(collection, presorted)
+        else:
+            keys = list(collection) if presorted else sorted(collection)
+            if self.root is not None:
+                existing = []
+                node = self._leftmost_leaf()
+                while node:
+                    existing.extend(node.keys)
+                    node = self._load(node.next)
+                if existing:
+                    keys = list(merge(existing, keys))
+        if self.compact:
+            keys = array(self.key_type, keys)
+
+        # Leaf level, each entry pairs a node reference with the smallest key below it
+        leaf_capacity = self.order - 1
+        leaf_target = max(1, round(fill_factor * leaf_capacity))
+        level = []
+        previous = None
+        start = 0
+        for size in self._chunk_sizes(len(keys), leaf_target, leaf_capacity, self.order // 2):
+            leaf = self.LeafNode()
+            leaf.keys = PrefixKeys(keys[start:start + size]) if self.compress_keys else keys[start:start + size]
+            if self.with_values:
+                leaf.values = values[start:start + size]
+            self._dirty(leaf)
+            low = leaf.keys[0]
+            if previous is not None:
+                previous.next = self._ref(leaf)
+                self._dirty(previous)
+                low = self._separator(previous.keys[-1], low)
+            level.append((self._ref(leaf), low))
+            previous = leaf
+            start += size
+        if not level:
+            self.root = self.LeafNode()
+            return
+
+        # Internal levels
+        child_target = max(2, round(fill_factor * self.order))
+        while len(level) > 1:
+            parents = []
+            start = 0
+            for size in self._chunk_sizes(len(level), child_target, self.order, (self.order - 1) // 2 + 1):
+                group = level[start:start + size]
+                parent = self.Node()
+                parent.children = [child for child, _ in group]
+                parent.keys.extend(low for _, low in group[1:])
+                self._dirty(parent)
+                parents.append((self._ref(parent), group[0][1]))
+                start += size
+            level = parents
+        self.root = self._load(level[0][0])
+
+    def _group_values(self, pairs, presorted):
+        """Sorts (key, value) pairs by key, merges in the pairs already in the tree and gathers the
+        values of each key, keeping their order.
+        :return: A tuple (keys, values) of two parallel lists holding every key once.
+        """
+        pairs = list(pairs) if presorted else sorted(pairs, key=itemgetter(0))
+        if self.root is not None:
+            pairs = merge(list(self._items(None, None)), pairs, key=itemgetter(0))
+        keys, values = [], []
+        for key, value in pairs:
+            if keys and keys[-1] == key:
+                entry = values[-1]
+                if type(entry) is PostingList:
+                    entry.append(value)
+                else:
+                    values[-1] = PostingList((entry, value))
+            else:
+                keys.append(key)
+                values.append(value)
+        return keys, values
+
+    @staticmethod
+    def _chunk_sizes(total, target, capacity, minimum):
+        """Splits `total` entries into near-equal groups of about `target` entries each.
+        Groups never exceed `capacity` and, when more than one group is needed, never fall
+        below `minimum`, so a bulk-loaded node is always as valid as an inserted one.
+        """
+        if total <= capacity:
+            return [total] if total else []
+        groups = -(-total // target)
+        if total // groups < minimum:
+            groups = max(1, total // minimum)
+        groups = max(groups, -(-total // capacity))
+        size, extra = divmod(total, groups)
+        return [size + 1 if i < extra else size for i in range(groups)]
+
     def insert(self, value, dense=True):
         """Inserts a value into the B+ tree, optionally as a dense tree.
         :param value: The value to be inserted.
         :param dense: Specifies whether to use dense mode for node splitting (default True).
         """
+        if self.with_values:
+            raise TypeError("A tree that stores values is updated with put")
         if not self.root:
             self.root = self.LeafNode()
-        
-        node = self._find_node(self.root, value)
+
+        path, node = self._find_path(value)
         index = self._locate_index(node.keys, value)
         node.keys.insert(index, value)
+        self._dirty(node)
 
         if len(node.keys) >= self.order:
-            self._split(node, dense)
+            self._split(node, path, dense)
+
+    def put(self, key, value, dense=True):
+        """Stores a value under a key of a tree that stores values.
+        A key that is already present keeps its place in the leaf and collects the value in its
+        PostingList, so duplicates never spread over several leaves.
+        :param key: The key.
+        :param value: The value, e.g. a row id or the record itself.
+        :param dense: Specifies whether to use dense mode for node splitting (default True).
+        """
+        if not self.with_values:
+            raise TypeError("put requires a tree created with with_values=True")
+        if not self.root:
+            self.root = self.LeafNode()
+
+        path, node = self._find_path(key)
+        index = bisect_left(node.keys, key)
+        if index < len(node.keys) and node.keys[index] == key:
+            self._append_value(node, index, value)
+            self._dirty(node)
+            return
+        node.keys.insert(index, key)
+        node.values.insert(index, value)
+        self._dirty(node)
+
+        if len(node.keys) >= self.order:
+            self._split(node, path, dense)
+
+    def _append_value(self, leaf, index, value):
+        """Adds a value to the entry at position index of a leaf, turning a single value into a PostingList."""
+        entry = leaf.values[index]
+        if type(entry) is PostingList:
+            entry.append(value)
+        else:
+            leaf.values[index] = PostingList((entry, value))
+
+    def get(self, key):
+        """Returns the values stored under a key, in the order they were put.
+        :param key: The key to look up.
+        :return: A list of values, empty if the key is not in the tree.
+        """
+        if not self.with_values:
+            raise TypeError("get requires a tree created with with_values=True")
+        if self.root is None:
+            return []
+        node = self._find_node(self.root, key)
+        index = bisect_left(node.keys, key)
+        if index < len(node.keys) and node.keys[index] == key:
+            entry = node.values[index]
+            return list(entry) if type(entry) is PostingList else [entry]
+        return []
+
+    def items(self, key_start=None, key_end=None):
+        """Lazily iterates over the (key, value) pairs within a range, in key order.
+        Values are read from the leaves, so no second lookup is needed.
+        :param key_start: The start of the key range, or None for the smallest key.
+        :param key_end: The end of the key range, or None for the largest key.
+        :return: An iterator over (key, value) pairs, one per stored value.
+        """
+        if not self.with_values:
+            raise TypeError("items requires a tree created with with_values=True")
+        if key_start is not None and key_end is not None and key_start > key_end:
+            raise ValueError(f"key_start {key_start} must be less than or equal to key_end {key_end}")
+        if self.root is None:
+            return iter(())
+        return self._items(key_start, key_end)
+
+    def _items(self, key_start, key_end):
+        for node, start, end in self._leaf_ranges(key_start, key_end):
+            for key, entry in zip(node.keys[start:end], node.values[start:end]):
+                if type(entry) is PostingList:
+                    for value in entry:
+                        yield key, value
+                else:
+                    yield key, entry
+
+    def remove(self, key, value):
+        """Removes one occurrence of a value stored under a key; the key goes once it has no values left.
+        :param key: The key.
+        :param value: The value to remove.
+        :return: True if the value was found and removed, otherwise False.
+        """
+        if not self.with_values:
+            raise TypeError("remove requires a tree created with with_values=True")
+        if self.root is None:
+            return False
+        path, node = self._find_path(key)
+        index = bisect_left(node.keys, key)
+        if index == len(node.keys) or node.keys[index] != key:
+            return False
+        entry = node.values[index]
+        if type(entry) is PostingList:
+            if value not in entry:
+                return False
+            remaining = list(entry)
+            remaining.remove(value)
+            node.values[index] = remaining[0] if len(remaining) == 1 else PostingList(remaining)
+            self._dirty(node)
+            return True
+        if entry != value:
+            return False
+        self._delete_at(node, index, path)
+        return True
+
+    def _find_path(self, value):
+        """Descends from the root to the leaf responsible for a value, recording the route.
+        The recorded path replaces any search for a parent node: the parent of the node at
+        depth d is simply path[d - 1], so splits and underflows find it in O(height).
+        :param value: The value to descend towards.
+        :return: A tuple (path, leaf) where path is a list of (internal node, child index) pairs.
+        """
+        path = []
+        node = self.root
+        while not node.is_leaf:
+            index = bisect_right(node.keys, value)
+            path.append((node, index))
+            node = node.children[index]
+        return path, node
 
     def _find_node(self, node, value):
         """Finds the appropriate leaf node for a given value.
@@ -54,12 +518,7 @@ class BPlusTree:
         :return: The leaf node where the value should be inserted.
         """
         while not node.is_leaf:
-            for i, key in enumerate(node.keys):
-                if value < key:
-                    node = node.children[i]
-                    break
-            else:
-                node = node.children[-1]
+            node = node.children[bisect_right(node.keys, value)]
         return node
 
     def _locate_index(self, keys, value):
@@ -68,81 +527,84 @@ class BPlusTree:
         :param value: The value to insert.
         :return: The index position where the value should be inserted.
         """
-        for i, key in enumerate(keys):
-            if value < key:
-                return i
-        return len(keys)
+        return bisect_right(keys, value)
 
-    def _split(self, node, dense):
+    def _split(self, node, path, dense):
         """Splits a node into two when it exceeds the order of the tree.
+        Leaves copy their first right-hand key up to the parent, internal nodes move their
+        middle key up so that every separator routes to exactly one child.
         :param node: The node to split.
+        :param path: The (parent, child index) pairs from the root down to the node.
         :param dense: Determines if the split uses dense packing.
         """
-        mid = self.order // 2 if dense else max(1, len(node.keys) - 1)
-        new_node = self.LeafNode() if node.is_leaf else self.Node()
-        new_node.keys = node.keys[mid:]
-        new_node.children = node.children[mid:] if not node.is_leaf else []
-
-        node.keys = node.keys[:mid]
-        node.children = node.children[:mid] if not node.is_leaf else []
-
-        # Handling leaf node specific operations
         if node.is_leaf:
+            mid = self.order // 2 if dense else max(1, len(node.keys) - 1)
+            new_node = self.LeafNode()
+            new_node.keys = node.keys[mid:]
+            node.keys = node.keys[:mid]
+            if self.with_values:
+                new_node.values = node.values[mid:]
+                node.values = node.values[:mid]
             new_node.next = node.next
-            node.next = new_node
-
-        if node == self.root:
-            new_root = self.Node()
-            new_root.keys = [new_node.keys[0]]
-            new_root.children = [node, new_node]
-            self.root = new_root
+            node.next = self._ref(new_node)
+            separator = self._separator(node.keys[-1], new_node.keys[0])
         else:
-            self._insert_in_parent(node, new_node.keys[0], new_node)
+            mid = self.order // 2
+            new_node = self.Node()
+            separator = node.keys[mid]
+            new_node.keys = node.keys[mid + 1:]
+            new_node.children = node.children[mid + 1:]
+            node.keys = node.keys[:mid]
+            node.children = node.children[:mid + 1]
+        self._dirty(node)
+        self._dirty(new_node)
+
+        self._insert_in_parent(node, separator, new_node, path)
 
-    def _insert_in_parent(self, node, key, new_node):
+    def _separator(self, low, high):
+        """Returns the key that goes up between two leaves, given the last key of the left leaf
+        and the first key of the right one. That is the right leaf's first key or, with
+        compress_keys, its shortest prefix that still sorts above the left leaf's last key.
+        """
+        if not self.compress_keys or not low < high:
+            return high
+        return high[:_common_prefix_length(low, high) + 1]
+
+    def _insert_in_parent(self, node, key, new_node, path):
         """Inserts a key in the parent node after splitting.
         :param node: The original node being split.
-        :param key: The smallest key in the new node created after split.
+        :param key: The separator between the original node and the new node.
         :param new_node: The new node created from splitting.
+        :param path: The (parent, child index) pairs from the root down to the original node.
         """
-        parent = self._find_parent(self.root, node)
-        if not parent:
+        if not path:
             self.root = self.Node()
-            self.root.keys = [key]
-            self.root.children = [node, new_node]
+            self.root.keys.append(key)
+            self.root.children = [self._ref(node), self._ref(new_node)]
+            self._dirty(self.root)
             return
-        
-        index = self._locate_index(parent.keys, key)
+
+        parent, index = path.pop()
         parent.keys.insert(index, key)
-        parent.children.insert(index + 1, new_node)
+        parent.children.insert(index + 1, self._ref(new_node))
+        self._dirty(parent)
 
         if len(parent.keys) >= self.order:
-            self._split(parent, True)
-
-    def _find_parent(self, current, child):
-        """Finds the parent node of a given child node.
-        :param current: The current node to check for being the parent.
-        :param child: The child node whose parent is being searched.
-        :return: The parent node if found, otherwise None.
-        """
-        if current.is_leaf or not current.children:
-            return None
-        for i, sub_node in enumerate(current.children):
-            if sub_node is child:
-                return current
-            if not sub_node.is_leaf:
-                found = self._find_parent(sub_node, child)
-                if found:
-                    return found
-        return None
+            self._split(parent, path, True)
 
     def search(self, key):
         """Searches for a key in the B+ tree.
         :param key: The key to search for.
         :return: True if the key is found, otherwise False.
         """
-        node = self._find_node(self.root, key)
-        return key in node.keys
+        if self.root is None:
+            return False
+        node = self._find_leaf(self.root, key)
+        index = bisect_left(node.keys, key)
+        if index == len(node.keys):
+            # Duplicates of the separator to the right of this leaf may continue in the next subtree
+            _, node, index = self._find_key_path(key)
+        return index < len(node.keys) and node.keys[index] == key
 
     def range_search(self, key_start, key_end):
         """Performs a range search to find all keys within the specified range.
@@ -154,114 +616,694 @@ class BPlusTree:
             raise ValueError(f"key_start {key_start} must be less than or equal to key_end {key_end}")
 
         results = []
+        if self.root is None:
+            return results
         current_node = self._find_leaf(self.root, key_start)
+        self._collect_range(current_node, bisect_left(current_node.keys, key_start), key_end, results)
+        return results
 
-        # Make sure we start from a node that actually has keys to compare
-        while current_node and current_node.keys[-1] < key_start:
-            current_node = current_node.next
-
-        # Collect all keys within the range starting from the found leaf node
+    def _collect_range(self, current_node, index, key_end, results):
+        """Appends keys up to key_end to results, starting at position index of a leaf."""
         while current_node:
-            for key in current_node.keys:
-                if key_start <= key <= key_end:
-                    results.append(key)
-                elif key > key_end:
-                    return results
-            current_node = current_node.next  # Move to the next leaf node
+            keys = current_node.keys
+            end = bisect_right(keys, key_end, index)
+            results.extend(keys[index:end])
+            if end < len(keys):
+                return
+            current_node = self._next_leaf(current_node)  # Move to the next leaf node
+            index = 0
+
+    def cursor(self, key_start=None, key_end=None, reverse=False, offset=0, limit=None):
+        """Lazily iterates over the keys within a range, one leaf at a time.
+        Nothing is materialized up front, so stopping early only costs the leaves visited.
+        :param key_start: The start of the key range, or None for the smallest key.
+        :param key_end: The end of the key range, or None for the largest key.
+        :param reverse: Iterate from key_end down to key_start (default False).
+        :param offset: The number of matching keys to skip first.
+        :param limit: The maximum number of keys to produce, or None for all of them.
+        :return: An iterator over the keys in ascending (or descending) order.
+        """
+        if key_start is not None and key_end is not None and key_start > key_end:
+            raise ValueError(f"key_start {key_start} must be less than or equal to key_end {key_end}")
+        if self.root is None:
+            return iter(())
+        keys = self._reverse_scan(key_start, key_end) if reverse else self._forward_scan(key_start, key_end)
+        return islice(keys, offset, None if limit is None else offset + limit)
+
+    def _forward_scan(self, key_start, key_end):
+        """Yields the keys in [key_start, key_end] following the leaf chain."""
+        for node, start, end in self._leaf_ranges(key_start, key_end):
+            yield from node.keys[start:end]
 
+    def _leaf_ranges(self, key_start, key_end):
+        """Yields a tuple (leaf, start, end) for every leaf holding keys in [key_start, key_end],
+        whose keys[start:end] lie within the range. A bound of None leaves that side open.
+        """
+        if key_start is None:
+            node, index = self._leftmost_leaf(), 0
+        else:
+            node = self._find_leaf(self.root, key_start)
+            index = bisect_left(node.keys, key_start)
+        while node:
+            keys = node.keys
+            end = len(keys) if key_end is None else bisect_right(keys, key_end, index)
+            yield node, index, end
+            if end < len(keys):
+                return
+            node = self._next_leaf(node)
+            index = 0
+
+    def _reverse_scan(self, key_start, key_end):
+        """Yields the keys in [key_start, key_end] from the largest down.
+        Leaves only link forward, so the previous leaf is reached through the descent path:
+        back up to the nearest ancestor with a child to the left, then down its rightmost edge.
+        """
+        path = []
+        node = self.root
+        while not node.is_leaf:
+            index = len(node.keys) if key_end is None else bisect_right(node.keys, key_end)
+            path.append((node, index))
+            node = self._load(node.children[index])
+        end = len(node.keys) if key_end is None else bisect_right(node.keys, key_end)
+        while True:
+            keys = node.keys
+            start = 0 if key_start is None else bisect_left(keys, key_start, 0, end)
+            yield from reversed(keys[start:end])
+            if start > 0:
+                return
+            while path and path[-1][1] == 0:
+                path.pop()
+            if not path:
+                return
+            parent, index = path.pop()
+            path.append((parent, index - 1))
+            node = self._load(parent.children[index - 1])
+            while not node.is_leaf:
+                path.append((node, len(node.keys)))
+                node = self._load(node.children[-1])
+            end = len(node.keys)
+
+    def search_many(self, keys):
+        """Searches for a batch of keys in one sweep along the leaf chain.
+        The probes are sorted and answered in order; the sweep walks to the next leaf while that
+        is cheaper than a fresh descent and descends again when the next probe is further away.
+        :param keys: The keys to search for.
+        :return: A list of booleans, True where the key at the same position was found.
+        """
+        keys = list(keys)
+        found = [False] * len(keys)
+        if self.root is None:
+            return found
+        max_hops = self._height()
+        node = None
+        for position in sorted(range(len(keys)), key=keys.__getitem__):
+            key = keys[position]
+            node = self._seek(node or self._find_leaf(self.root, key), key, max_hops)
+            index = bisect_left(node.keys, key)
+            found[position] = index < len(node.keys) and node.keys[index] == key
+        return found
+
+    def range_search_many(self, ranges):
+        """Performs a batch of range searches in one sweep along the leaf chain.
+        :param ranges: (key_start, key_end) pairs.
+        :return: A list holding the keys found for each range, in the order the ranges were given.
+        """
+        ranges = list(ranges)
+        for key_start, key_end in ranges:
+            if key_start > key_end:
+                raise ValueError(f"key_start {key_start} must be less than or equal to key_end {key_end}")
+        results = [[] for _ in ranges]
+        if self.root is None:
+            return results
+        max_hops = self._height()
+        node = None
+        for position in sorted(range(len(ranges)), key=ranges.__getitem__):
+            key_start, key_end = ranges[position]
+            node = self._seek(node or self._find_leaf(self.root, key_start), key_start, max_hops)
+            # Overlapping ranges rescan from the sweep position without moving it
+            self._collect_range(node, bisect_left(node.keys, key_start), key_end, results[position])
         return results
 
+    def _seek(self, node, key, max_hops):
+        """Moves forward from a leaf to the first leaf that may hold keys >= key.
+        Follows at most max_hops `next` links before falling back to a descent from the root.
+        """
+        for _ in range(max_hops):
+            if (node.keys and node.keys[-1] >= key) or node.next is None:
+                return node
+            node = self._next_leaf(node)
+        if not node.keys or node.keys[-1] < key:
+            node = self._find_leaf(self.root, key)
+            while (not node.keys or node.keys[-1] < key) and node.next is not None:
+                node = self._next_leaf(node)
+        return node
+
+    def _height(self):
+        """Returns the number of levels in the tree, 0 for an empty tree."""
+        height = 0
+        node = self.root
+        while node is not None:
+            height += 1
+            node = None if node.is_leaf else self._load(node.children[0])
+        return height
+
     def delete(self, key):
-        """Deletes a key from the B+ tree.
+        """Deletes a key from the B+ tree, together with all its values in a tree that stores values.
         :param key: The key to delete.
         :return: True if the key was successfully deleted, otherwise False.
         """
-        node = self._find_leaf(self.root, key)
-        if key in node.keys:
-            node.keys.remove(key)
-            if len(node.keys) < self.order // 2 and node != self.root:
-                self._handle_underflow(node)
+        if self.root is None:
+            return False
+        path, node, index = self._find_key_path(key, update=True)
+        if index < len(node.keys) and node.keys[index] == key:
+            self._delete_at(node, index, path)
             return True
         return False
 
-    def _handle_underflow(self, node):
-        """Handles underflow in a leaf or internal node by borrowing or merging."""
-        parent = self._find_parent(self.root, node)
-        if parent is None:
-            return  # If there's no parent, node is the root and cannot underflow
-        
-        index = parent.children.index(node)
-        left_sibling = parent.children[index - 1] if index > 0 else None
-        right_sibling = parent.children[index + 1] if index + 1 < len(parent.children) else None
-
-        # Try to borrow from siblings
-        if left_sibling and len(left_sibling.keys) > self.order // 2:
-            # Borrow the last key from the left sibling
-            borrowed_key = left_sibling.keys.pop(-1)
-            node.keys.insert(0, borrowed_key)
-            if not node.is_leaf:
-                borrowed_child = left_sibling.children.pop(-1)
-                node.children.insert(0, borrowed_child)
-            # Update parent's key
-            parent.keys[index - 1] = node.keys[0]
-        elif right_sibling and len(right_sibling.keys) > self.order // 2:
-            # Borrow the first key from the right sibling
-            borrowed_key = right_sibling.keys.pop(0)
-            node.keys.append(borrowed_key)
-            if not node.is_leaf:
-                borrowed_child = right_sibling.children.pop(0)
-                node.children.append(borrowed_child)
-            # Update parent's key
-            parent.keys[index] = right_sibling.keys[0]
+    def _delete_at(self, node, index, path):
+        """Removes the key at position index of a leaf, with its values, and fixes any underflow."""
+        del node.keys[index]
+        if self.with_values:
+            del node.values[index]
+        self._dirty(node)
+        if path and len(node.keys) < self._min_keys(node):
+            self._handle_underflow(node, path)
+
+    def _min_keys(self, node):
+        """Returns the fewest keys a non-root node may hold before it underflows.
+        Internal nodes use ceil(order / 2) - 1 so that a merge, which pulls the parent
+        separator down, never produces a node that has to split again.
+        """
+        return self.order // 2 if node.is_leaf else (self.order - 1) // 2
+
+    def delete_range(self, key_start, key_end):
+        """Deletes every key within the specified range in one pass.
+        Subtrees lying wholly inside the range are unlinked at once, the leaf chain is joined
+        across them, and only the nodes along the two range boundaries are trimmed and then
+        rebalanced, once per level.
+        :param key_start: The start of the key range.
+        :param key_end: The end of the key range.
+        :return: The number of keys deleted.
+        """
+        if key_start > key_end:
+            raise ValueError(f"key_start {key_start} must be less than or equal to key_end {key_end}")
+        if self.root is None:
+            return 0
+        deleted = self._prune(self._writable_root(), key_start, key_end)
+        self._collapse_root()
+        return deleted
+
+    def delete_many(self, keys):
+        """Deletes a batch of keys, rebalancing every affected node once after all its keys are gone.
+        Each listed key removes one occurrence, as `delete` does; for distinct keys the result is
+        the same as calling `delete` for every key.
+        :param keys: The keys to delete.
+        :return: The number of keys deleted.
+        """
+        keys = sorted(keys)
+        if self.root is None or not keys:
+            return 0
+        missed = self._delete_batch(self._writable_root(), keys)
+        self._collapse_root()
+        return len(keys) - len(missed)
+
+    def _prune(self, node, lo, hi):
+        """Removes the keys within [lo, hi] below a node and rebalances the children it keeps.
+        A bound of None leaves that side open: the node lies wholly inside the range there.
+        :return: The number of keys removed.
+        """
+        if node.is_leaf:
+            start = 0 if lo is None else bisect_left(node.keys, lo)
+            end = len(node.keys) if hi is None else bisect_right(node.keys, hi)
+            del node.keys[start:end]
+            if self.with_values:
+                del node.values[start:end]
+            self._dirty(node)
+            return end - start
+
+        first = 0 if lo is None else bisect_left(node.keys, lo)
+        last = len(node.keys) if hi is None else bisect_right(node.keys, hi)
+        if lo is not None and hi is not None and first == last:
+            deleted = self._prune(self._writable_child(node, first), lo, hi)
+            self._rebalance_child(node, first, deep=True)
+            return deleted
+
+        # Keep the boundary children, drop every child strictly between them
+        left = self._writable_child(node, first) if lo is not None else None
+        right = self._writable_child(node, last) if hi is not None else None
+        if left is not None and right is not None:
+            # Join the leaf chain across the dropped leaves before any merge follows it
+            left_leaf, right_leaf = left, right
+            while not left_leaf.is_leaf:
+                left_leaf = self._writable_child(left_leaf, bisect_left(left_leaf.keys, lo))
+            while not right_leaf.is_leaf:
+                right_leaf = self._writable_child(right_leaf, bisect_right(right_leaf.keys, hi))
+            left_leaf.next = self._ref(right_leaf)
+            self._dirty(left_leaf)
+        drop_start = first + 1 if left is not None else 0
+        drop_end = last if right is not None else len(node.children)
+        deleted = sum(self._drop_subtree(self._load(child)) for child in node.children[drop_start:drop_end])
+        del node.children[drop_start:drop_end]
+        if left is None:
+            del node.keys[:last]
+        elif right is None:
+            del node.keys[first:]
+        else:
+            del node.keys[first:last - 1]
+        self._dirty(node)
+
+        kept = []
+        if left is not None:
+            deleted += self._prune(left, lo, None)
+            kept.append(left)
+        if right is not None:
+            deleted += self._prune(right, None, hi)
+            kept.append(right)
+        self._rebalance_children(node, kept)
+        return deleted
+
+    def _delete_batch(self, node, keys):
+        """Removes one occurrence of every key in keys, which is sorted, from below a node, then
+        rebalances the children it touched.
+        :return: The keys that were not found, in order.
+        """
+        missed = []
+        if node.is_leaf:
+            for key in keys:
+                index = bisect_left(node.keys, key)
+                if index < len(node.keys) and node.keys[index] == key:
+                    del node.keys[index]
+                    if self.with_values:
+                        del node.values[index]
+                else:
+                    missed.append(key)
+            if len(missed) < len(keys):
+                self._dirty(node)
+            return missed
+
+        touched = []
+        carried = []
+        start = 0
+        while start < len(keys) or carried:
+            # Route the batch exactly like _find_key_path routes a single key: keys equal to a
+            # separator that its left-hand subtree did not hold are carried to the next subtree
+            index = index + 1 if carried else bisect_left(node.keys, keys[start])
+            split = len(keys) if index == len(node.keys) else bisect_right(keys, node.keys[index], start)
+            child = self._writable_child(node, index)
+            left = self._delete_batch(child, carried + keys[start:split])
+            touched.append(child)
+            start = split
+            carried = [] if index == len(node.keys) else [key for key in left if key == node.keys[index]]
+            missed.extend(key for key in left if index == len(node.keys) or key != node.keys[index])
+        self._rebalance_children(node, touched)
+        return missed
+
+    def _drop_subtree(self, node):
+        """Discards a subtree lying wholly inside a deleted range.
+        :return: The number of keys it held.
+        """
+        self._discard(node)
+        if node.is_leaf:
+            return len(node.keys)
+        return sum(self._drop_subtree(self._load(child)) for child in node.children)
+
+    def _handle_underflow(self, node, path):
+        """Handles underflow in a leaf or internal node by borrowing or merging.
+        :param node: The node holding too few keys.
+        :param path: The (parent, child index) pairs from the root down to the node.
+        """
+        parent, index = path.pop()
+        self._rebalance_child(parent, index)
+        if not path:
+            self._collapse_root()
+        elif len(parent.keys) < self._min_keys(parent):
+            self._handle_underflow(parent, path)
+
+    def _rebalance_children(self, parent, children):
+        """Rebalances each of the given children of a node that is short and still attached to it."""
+        for child in children:
+            if len(child.keys) >= self._min_keys(child):
+                continue
+            ref = self._ref(child)
+            if ref in parent.children:
+                self._rebalance_child(parent, parent.children.index(ref), deep=True)
+
+    def _rebalance_child(self, parent, index, deep=False):
+        """Borrows from or merges with siblings until a child holds enough keys.
+        A single delete leaves the child one key short, so one borrow or merge is enough; batch
+        deletes may leave it far shorter and repeat the step.
+        :param parent: The parent of the child.
+        :param index: The position of the child among the parent's children.
+        :param deep: Also rebalance the grandchildren that the moves brought next to new
+                     siblings, which batch deletes may have left short as well.
+        """
+        node = self._writable_child(parent, index)
+        min_keys = self._min_keys(node)
+        while True:
+            moved = False
+            while len(node.keys) < min_keys and len(parent.children) > 1:
+                moved = True
+                left_sibling = self._writable_child(parent, index - 1) if index > 0 else None
+                right_sibling = self._writable_child(parent, index + 1) if index + 1 < len(parent.children) else None
+                # Try to borrow from siblings, then merge, always folding right into left
+                if left_sibling and len(left_sibling.keys) > min_keys:
+                    self._shift_right(parent, index - 1, left_sibling, node)
+                elif right_sibling and len(right_sibling.keys) > min_keys:
+                    self._shift_left(parent, index, node, right_sibling)
+                elif left_sibling:
+                    self._merge(parent, index - 1, left_sibling, node)
+                    node, index = left_sibling, index - 1
+                else:
+                    self._merge(parent, index, node, right_sibling)
+            self._dirty(parent)
+            if not (deep and moved) or node.is_leaf:
+                return
+            short = [child for child in map(self._load, node.children) if len(child.keys) < self._min_keys(child)]
+            if not short or len(node.children) == 1:
+                return
+            # Fixing the grandchildren may merge them and leave this node short again
+            self._rebalance_children(node, short)
+
+    def _shift_right(self, parent, index, left, right):
+        """Moves one key from a node into its right sibling.
+        :param index: The position of the left node among the parent's children.
+        """
+        if right.is_leaf:
+            right.keys.insert(0, left.keys.pop(-1))
+            if self.with_values:
+                right.values.insert(0, left.values.pop(-1))
+            parent.keys[index] = self._separator(left.keys[-1], right.keys[0])
+        else:
+            # Rotate through the parent: the separator comes down, the sibling's last key goes up
+            right.keys.insert(0, parent.keys[index])
+            parent.keys[index] = left.keys.pop(-1)
+            right.children.insert(0, left.children.pop(-1))
+        self._dirty(left)
+        self._dirty(right)
+
+    def _shift_left(self, parent, index, left, right):
+        """Moves one key from a node into its left sibling.
+        :param index: The position of the left node among the parent's children.
+        """
+        if left.is_leaf:
+            left.keys.append(right.keys.pop(0))
+            if self.with_values:
+                left.values.append(right.values.pop(0))
+            parent.keys[index] = self._separator(left.keys[-1], right.keys[0])
         else:
-            # Merge with a sibling
-            if left_sibling:
-                # Merge node into left_sibling
-                left_sibling.keys.extend(node.keys)
-                if not node.is_leaf:
-                    left_sibling.children.extend(node.children)
-                # Remove node from parent
-                parent.keys.pop(index - 1)
-                parent.children.pop(index)
-            elif right_sibling:
-                # Merge right_sibling into node
-                node.keys.extend(right_sibling.keys)
-                if not node.is_leaf:
-                    node.children.extend(right_sibling.children)
-                # Remove right_sibling from parent
-                parent.keys.pop(index)
-                parent.children.pop(index + 1)
-            
-            if len(parent.keys) < self.order // 2:
-                self._handle_underflow(parent)
-
-        if self.root.keys == []:
-            # If the root node is empty, make its first child the new root
-            if not self.root.is_leaf:
-                self.root = self.root.children[0]
-                self.root.parent = None
+            left.keys.append(parent.keys[index])
+            parent.keys[index] = right.keys.pop(0)
+            left.children.append(right.children.pop(0))
+        self._dirty(left)
+        self._dirty(right)
+
+    def _collapse_root(self):
+        """Replaces an internal root without keys by its only child, as often as needed."""
+        root = self.root
+        while not root.is_leaf and not root.keys:
+            self.root = self._load(root.children[0])
+            self._discard(root)
+            root = self.root
+
+    def _merge(self, parent, index, left, right):
+        """Merges the right node into its left sibling and drops the separator between them.
+        :param parent: The common parent of both nodes.
+        :param index: The position of the left node among the parent's children.
+        :param left: The node that absorbs the keys.
+        :param right: The node that is removed from the tree.
+        """
+        separator = parent.keys.pop(index)
+        parent.children.pop(index + 1)
+        if left.is_leaf:
+            left.keys.extend(right.keys)
+            if self.with_values:
+                left.values.extend(right.values)
+            left.next = right.next
+        else:
+            left.keys.append(separator)
+            left.keys.extend(right.keys)
+            left.children.extend(right.children)
+        self._dirty(left)
+        self._discard(right)
+
+    def _find_key_path(self, key, update=False):
+        """Descends to the leaf holding the first occurrence of a key, recording the route like _find_path.
+        Like _find_leaf it descends with bisect_left, so duplicates of a separator that remained in
+        the left-hand subtree are found. If that leaf holds no key >= key and the separator to its
+        right equals the key, the search continues in the next subtree along the recorded route;
+        the `next` chain is not followed, as copy-on-write leaves do not keep it reliable.
+        :param update: Descend through _writable_root and _writable_child, for an update of the leaf.
+        :return: A tuple (path, leaf, index), index being the position of the first key >= key in the leaf.
+        """
+        if update:
+            child = self._writable_child
+            node = self._writable_root()
+        else:
+            child = lambda parent, index: self._load(parent.children[index])
+            node = self.root
+        path = []
+        while not node.is_leaf:
+            index = bisect_left(node.keys, key)
+            path.append((node, index))
+            node = child(node, index)
+        index = bisect_left(node.keys, key)
+        while index == len(node.keys):
+            depth = len(path) - 1
+            while depth >= 0 and path[depth][1] == len(path[depth][0].keys):
+                depth -= 1
+            if depth < 0 or path[depth][0].keys[path[depth][1]] != key:
+                break
+            parent, position = path[depth]
+            del path[depth:]
+            path.append((parent, position + 1))
+            node = child(parent, position + 1)
+            while not node.is_leaf:
+                path.append((node, 0))
+                node = child(node, 0)
+            index = bisect_left(node.keys, key)
+        return path, node, index
 
     def _find_leaf(self, node, key):
-        """Helper function to find the leaf node containing the key and its parent."""
+        """Finds the leftmost leaf node that may contain the key.
+        Descending with bisect_left keeps duplicates of a separator that remained in the
+        left-hand leaf reachable, which is what range scans need.
+        """
         while not node.is_leaf:
-            found = False
-            for i in range(len(node.keys)):
-                if key < node.keys[i]:
-                    node = node.children[i]
-                    found = True
-                    break
-            if not found:
-                node = node.children[-1]  # Move to the right-most child if key is greater than all keys in the node
+            node = node.children[bisect_left(node.keys, key)]
+        return node
+
+    def _writable_root(self):
+        """Returns the root for an update that will modify it."""
+        return self.root
+
+    def _writable_child(self, parent, index):
+        """Returns a child of a node for an update that will modify it."""
+        return self._load(parent.children[index])
+
+    def _leftmost_leaf(self):
+        """Returns the first leaf of the chain, or None for an empty tree."""
+        node = self.root
+        while node is not None and not node.is_leaf:
+            node = self._load(node.children[0])
+        return node
+
+    def _next_leaf(self, leaf):
+        """Returns the leaf that follows a leaf in the chain, or None after the last one."""
+        return self._load(leaf.next)
+
+    # Storage hooks. An in-memory tree links nodes directly, so these are no-ops; a tree that
+    # keeps its nodes elsewhere (see Paged_B_plus_tree) overrides them and the hot descent loops.
+    def _load(self, ref):
+        """Returns the node behind a child or `next` reference."""
+        return ref
+
+    def _ref(self, node):
+        """Returns the reference under which a parent or a previous leaf stores a node."""
+        return node
+
+    def _dirty(self, node):
+        """Records that a node was modified."""
+
+    def _discard(self, node):
+        """Records that a node was removed from the tree."""
+
+    def memory_usage(self):
+        """Estimates the bytes held by the tree: node objects, their key and child containers
+        and the key objects stored in the leaves (separators in internal nodes share them).
+        A tree that stores values adds the value lists and PostingLists, but not the values.
+        With compress_keys the truncated separators are separate strings and are counted too.
+        :return: A tuple (total bytes, number of keys).
+        """
+        if self.root is None:
+            return 0, 0
+        total, num_keys = 0, 0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            total += sys.getsizeof(node) + sys.getsizeof(node.keys)
+            if hasattr(node, '__dict__'):
+                total += sys.getsizeof(node.__dict__)
+            if node.is_leaf:
+                num_keys += len(node.keys)
+                if self.compress_keys:
+                    total += sys.getsizeof(node.keys.prefix) + sys.getsizeof(node.keys.suffixes)
+                    total += sum(sys.getsizeof(suffix) for suffix in node.keys.suffixes)
+                    total += sys.getsizeof(node.children)
+                elif not self.compact:
+                    total += sum(sys.getsizeof(key) for key in node.keys)
+                    total += sys.getsizeof(node.children)
+                if self.with_values:
+                    total += sys.getsizeof(node.values)
+                    total += sum(sys.getsizeof(entry) for entry in node.values if type(entry) is PostingList)
+            else:
+                total += sys.getsizeof(node.children)
+                if self.compress_keys:
+                    total += sum(sys.getsizeof(key) for key in node.keys)
+                stack.extend(self._load(child) for child in node.children)
+        return total, num_keys
+
+    def stats(self):
+        """Summarizes the shape of the tree without printing it.
+        Fill histograms count nodes by their share of the order - 1 keys a node can hold,
+        in ten buckets of 10% each (the last one includes full nodes).
+        :return: A dict with the height, the nodes and keys on each level from the root down,
+                 the leaf and internal fill histograms and averages, and the memory estimate.
+        """
+        capacity = self.order - 1
+        levels = []
+        leaf_fill, internal_fill = [0] * 10, [0] * 10
+        level = [] if self.root is None else [self.root]
+        while level:
+            num_keys = sum(len(node.keys) for node in level)
+            levels.append({'nodes': len(level), 'keys': num_keys, 'fill': num_keys / (len(level) * capacity)})
+            histogram = leaf_fill if level[0].is_leaf else internal_fill
+            for node in level:
+                histogram[min(9, 10 * len(node.keys) // capacity)] += 1
+            level = [self._load(child) for node in level for child in node.children]
+        memory, num_keys = self.memory_usage()
+        internal = levels[:-1]
+        internal_keys = sum(row['keys'] for row in internal)
+        internal_nodes = sum(row['nodes'] for row in internal)
+        return {'height': len(levels),
+                'levels': levels,
+                'num_keys': num_keys,
+                'leaf_nodes': levels[-1]['nodes'] if levels else 0,
+                'internal_nodes': internal_nodes,
+                'leaf_fill': levels[-1]['fill'] if levels else 0.0,
+                'internal_fill': internal_keys / (internal_nodes * capacity) if internal_nodes else 0.0,
+                'leaf_fill_histogram': leaf_fill,
+                'internal_fill_histogram': internal_fill,
+                'memory_bytes': memory,
+                'bytes_per_key': memory / num_keys if num_keys else 0.0}
+
+    def enable_instrumentation(self):
+        """Starts counting node visits, key comparisons, leaf-chain hops, splits, borrows and
+        merges for every public operation. Comparisons are those of the root-to-leaf descents,
+        counted as the log2(n + 1) steps a binary search over n keys takes.
+        :return: The OperationCounters that collect the counts, also kept as `counters`.
+        """
+        if self.counters is None:
+            self.counters = OperationCounters()
+            for name in self._COUNTED_HOOKS:
+                setattr(self, name, getattr(self, '_counted' + name))
+            for name in self._COUNTED_OPERATIONS:
+                setattr(self, name, self._counted_operation(name))
+        return self.counters
+
+    def disable_instrumentation(self):
+        """Stops counting and restores the uninstrumented methods."""
+        for name in self._COUNTED_HOOKS + self._COUNTED_OPERATIONS:
+            self.__dict__.pop(name, None)
+        self.counters = None
+
+    def operation_counts(self):
+        """Returns the counts collected since instrumentation was enabled, see OperationCounters.summary."""
+        return {} if self.counters is None else self.counters.summary()
+
+    def _counted_operation(self, name):
+        method = getattr(type(self), name)
+        counters = self.counters
+        if name in ('cursor', 'items'):
+            def counted(*args, **kwargs):
+                with counters.operation(name):
+                    keys = method(self, *args, **kwargs)
+                return counters.iterate(name, keys)
+        else:
+            def counted(*args, **kwargs):
+                with counters.operation(name):
+                    return method(self, *args, **kwargs)
+        return counted
+
+    def _counted_descent(self, node, key, bisect):
+        visits = comparisons = 0
+        while True:
+            visits += 1
+            comparisons += len(node.keys).bit_length()
+            if node.is_leaf:
+                break
+            node = self._load(node.children[bisect(node.keys, key)])
+        self.counters.record('node_visits', visits)
+        self.counters.record('key_comparisons', comparisons)
         return node
-    
+
+    def _counted_find_path(self, value):
+        path, node = type(self)._find_path(self, value)
+        self.counters.record('node_visits', len(path) + 1)
+        self.counters.record('key_comparisons', len(node.keys).bit_length() +
+                             sum(len(parent.keys).bit_length() for parent, _ in path))
+        return path, node
+
+    def _counted_find_node(self, node, value):
+        return self._counted_descent(node, value, bisect_right)
+
+    def _counted_find_leaf(self, node, key):
+        return self._counted_descent(node, key, bisect_left)
+
+    def _counted_find_key_path(self, key, update=False):
+        path, node, index = type(self)._find_key_path(self, key, update)
+        # An update loads every node below the root through the counted _writable_child
+        self.counters.record('node_visits', 1 if update else len(path) + 1)
+        self.counters.record('key_comparisons', len(node.keys).bit_length() +
+                             sum(len(parent.keys).bit_length() for parent, _ in path))
+        return path, node, index
+
+    def _counted_leftmost_leaf(self):
+        self.counters.record('node_visits', self._height())
+        return type(self)._leftmost_leaf(self)
+
+    def _counted_next_leaf(self, leaf):
+        self.counters.record('leaf_hops')
+        self.counters.record('node_visits')
+        return type(self)._next_leaf(self, leaf)
+
+    def _counted_writable_child(self, parent, index):
+        self.counters.record('node_visits')
+        return type(self)._writable_child(self, parent, index)
+
+    def _counted_split(self, node, path, dense):
+        self.counters.record('splits')
+        type(self)._split(self, node, path, dense)
+
+    def _counted_shift_left(self, parent, index, left, right):
+        self.counters.record('borrows')
+        type(self)._shift_left(self, parent, index, left, right)
+
+    def _counted_shift_right(self, parent, index, left, right):
+        self.counters.record('borrows')
+        type(self)._shift_right(self, parent, index, left, right)
+
+    def _counted_merge(self, parent, index, left, right):
+        self.counters.record('merges')
+        type(self)._merge(self, parent, index, left, right)
+
     def display_tree(self, node=None, level=0):
         if node is None:
             node = self.root
         if node.is_leaf:
-            print('  ' * level + f"Leaf: {node.keys}")
+            print('  ' * level + f"Leaf: {list(node.keys)}")
         else:
-            print('  ' * level + f"Internal: {node.keys}")
-        for child in node.children:
+            print('  ' * level + f"Internal: {list(node.keys)}")
+        for child in map(self._load, node.children):
             self.display_tree(child, level + 1)
 
     def display_tree_as_string(self, node=None, level=0, result=None):
@@ -273,15 +1315,15 @@ class BPlusTree:
         # Format the node description
         indent = '    ' * level
         if node.is_leaf:
-            node_description = f"{indent}Leaf: {node.keys}"
+            node_description = f"{indent}Leaf: {list(node.keys)}"
         else:
-            node_description = f"{indent}Internal: {node.keys}"
+            node_description = f"{indent}Internal: {list(node.keys)}"
 
         # Append the node description to the result list
         result.append(node_description)
 
         # Recursively do this for all children (if any)
-        for child in node.children:
+        for child in map(self._load, node.children):
             self.display_tree_as_string(child, level + 1, result)
 
         # Return the joined result if at the root level
@@ -300,12 +1342,12 @@ class BPlusTree:
 
         def add_nodes_edges(node, graph, node_id, level=0):
             """ Recursive helper function to add nodes and edges to the graph. """
-            node_label = f"{node.keys}"
+            node_label = f"{list(node.keys)}"
             graph.add_node(node_id, label=node_label, subset=level)
             node_labels[node_id] = node_label
 
             child_id = node_id + 1
-            for child in node.children:
+            for child in map(self._load, node.children):
                 graph.add_edge(node_id, child_id)
                 child_id = add_nodes_edges(child, graph, child_id, level + 1)
             return child_id
@@ -322,14 +1364,12 @@ class BPlusTree:
     def verify_leaf_chain(self):
         
         # Start at the leftmost leaf node
-        node = self.root
-        while not node.is_leaf:
-            node = node.children[0]  # Navigate to the leftmost child until we hit a leaf
+        node = self._leftmost_leaf()
         all_leaves = []
         # Traverse the linked leaves and print their keys
         while node:
             all_leaves.extend(node.keys)
-            node = node.next
+            node = self._load(node.next)
         # Convert each key to string and join with '->'
         all_leaves_as_strings = [str(key) for key in all_leaves]  # Convert each key to string
         leaves_chain = " --> ".join(all_leaves_as_strings)  # Join all keys as strings with arrows between them
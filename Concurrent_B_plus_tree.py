@@ -0,0 +1,279 @@
+import threading
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from operator import itemgetter
+from B_plus_tree_refactored import BPlusTree, PostingList
+
+
+class BPlusTreeSnapshot(BPlusTree):
+    """A read-only view of a CopyOnWriteBPlusTree as it was when the snapshot was taken.
+    Published nodes are never modified, so a snapshot can be read from any thread without locks.
+    Leaves of a copy-on-write tree do not keep a reliable `next` chain (a copied leaf would
+    force a copy of its predecessor, and so on down the chain), so scans walk the tree instead.
+    """
+    def __init__(self, root, version, order, compact=False, key_type='q', with_values=False, compress_keys=False):
+        super().__init__(order, compact, key_type, with_values, compress_keys)
+        self.root = root
+        self.version = version
+
+    def insert(self, value, dense=True):
+        raise TypeError("B+ tree snapshots are read-only")
+
+    def delete(self, key):
+        raise TypeError("B+ tree snapshots are read-only")
+
+    def delete_range(self, key_start, key_end):
+        raise TypeError("B+ tree snapshots are read-only")
+
+    def delete_many(self, keys):
+        raise TypeError("B+ tree snapshots are read-only")
+
+    def bulk_load(self, collection, dense=True, presorted=False, fill_factor=None):
+        raise TypeError("B+ tree snapshots are read-only")
+
+    def put(self, key, value, dense=True):
+        raise TypeError("B+ tree snapshots are read-only")
+
+    def remove(self, key, value):
+        raise TypeError("B+ tree snapshots are read-only")
+
+    def range_search(self, key_start, key_end):
+        if key_start > key_end:
+            raise ValueError(f"key_start {key_start} must be less than or equal to key_end {key_end}")
+        if self.root is None:
+            return []
+        return list(self._forward_scan(key_start, key_end))
+
+    def range_search_many(self, ranges):
+        return [self.range_search(key_start, key_end) for key_start, key_end in ranges]
+
+    def search_many(self, keys):
+        keys = list(keys)
+        found = [False] * len(keys)
+        if self.root is None:
+            return found
+        max_hops = self._height()
+        leaves = node = None
+        for position in sorted(range(len(keys)), key=keys.__getitem__):
+            key = keys[position]
+            if leaves is None:
+                leaves = self._leaves_from(key)
+                node = next(leaves)
+            hops = 0
+            # Walk on while that is cheaper than a fresh descent, as BPlusTree._seek does
+            while not node.keys or node.keys[-1] < key:
+                if hops == max_hops:
+                    leaves, hops = self._leaves_from(key), 0
+                node = next(leaves, None)
+                if node is None:
+                    return found
+                hops += 1
+            index = bisect_left(node.keys, key)
+            found[position] = index < len(node.keys) and node.keys[index] == key
+        return found
+
+    def _leaf_ranges(self, key_start, key_end):
+        index = 0 if key_start is None else None
+        for node in self._leaves_from(key_start):
+            keys = node.keys
+            if index is None:
+                index = bisect_left(keys, key_start)
+            end = len(keys) if key_end is None else bisect_right(keys, key_end, index)
+            yield node, index, end
+            if end < len(keys):
+                return
+            index = 0
+
+    def _leaves_from(self, key):
+        """Yields the leaves in key order, starting with the leftmost one that may hold key.
+        The next leaf is reached through the descent path: back up to the nearest ancestor with
+        a child to the right, then down its leftmost edge.
+        """
+        path = []
+        node = self.root
+        while not node.is_leaf:
+            index = 0 if key is None else bisect_left(node.keys, key)
+            path.append((node, index))
+            node = node.children[index]
+        while True:
+            yield node
+            while path and path[-1][1] == len(path[-1][0].keys):
+                path.pop()
+            if not path:
+                return
+            parent, index = path.pop()
+            path.append((parent, index + 1))
+            node = parent.children[index + 1]
+            while not node.is_leaf:
+                path.append((node, 0))
+                node = node.children[0]
+
+
+class _PathCopyingWriter(BPlusTree):
+    """Applies one update to a private version of a tree.
+    Every node the update touches is copied first, so the published version stays intact.
+    """
+    def __init__(self, tree, root):
+        super().__init__(tree.order, tree.compact, tree.key_type, tree.with_values, tree.compress_keys)
+        self.root = root
+        self._private = set()
+
+    def _copy(self, node):
+        """Returns a private copy of a node, or the node itself if this update already owns it."""
+        if id(node) in self._private:
+            return node
+        clone = self.LeafNode() if node.is_leaf else self.Node()
+        clone.keys = node.keys[:]
+        if node.is_leaf:
+            clone.next = node.next
+            if self.with_values:
+                clone.values = node.values[:]
+        else:
+            clone.children = node.children[:]
+        self._private.add(id(clone))
+        return clone
+
+    def _find_path(self, value):
+        """Descends like BPlusTree._find_path, replacing every node on the way by a private copy."""
+        path = []
+        node = self._writable_root()
+        while not node.is_leaf:
+            index = bisect_right(node.keys, value)
+            path.append((node, index))
+            node = self._writable_child(node, index)
+        return path, node
+
+    def _append_value(self, leaf, index, value):
+        """Adds a value to a key's entry, copying a PostingList that the published version shares."""
+        entry = leaf.values[index]
+        if type(entry) is PostingList and id(entry) in self._private:
+            entry.append(value)
+            return
+        entry = PostingList(entry) if type(entry) is PostingList else PostingList((entry,))
+        entry.append(value)
+        leaf.values[index] = entry
+        self._private.add(id(entry))
+
+    def _writable_root(self):
+        self.root = self._copy(self.root)
+        return self.root
+
+    def _writable_child(self, parent, index):
+        child = parent.children[index] = self._copy(parent.children[index])
+        return child
+
+
+class CopyOnWriteBPlusTree(BPlusTree):
+    """A B+ tree for many concurrent readers and a single writer at a time.
+    Writers copy the nodes along the path they modify and publish the new root with a single
+    assignment. Readers never take a lock: each read works on the root it saw when it started,
+    and `snapshot` hands out a consistent read-only view that later writes cannot change.
+    Writers are serialized by a lock.
+    """
+    def __init__(self, order, compact=False, key_type='q', with_values=False, compress_keys=False):
+        super().__init__(order, compact, key_type, with_values, compress_keys)
+        self._head = (None, 0)
+        self._write_lock = threading.Lock()
+
+    @property
+    def root(self):
+        return self._head[0]
+
+    @root.setter
+    def root(self, node):
+        # Only reached from BPlusTree.__init__; updates publish through _publish
+        self._head = (node, 0)
+
+    @property
+    def version(self):
+        """The number of updates published so far."""
+        return self._head[1]
+
+    def snapshot(self):
+        """Returns a read-only view of the latest published version."""
+        root, version = self._head
+        return BPlusTreeSnapshot(root, version, self.order, self.compact, self.key_type,
+                                 self.with_values, self.compress_keys)
+
+    def insert(self, value, dense=True):
+        with self._write_lock:
+            writer = _PathCopyingWriter(self, self.root)
+            writer.insert(value, dense)
+            self._publish(writer.root)
+
+    def put(self, key, value, dense=True):
+        with self._write_lock:
+            writer = _PathCopyingWriter(self, self.root)
+            writer.put(key, value, dense)
+            self._publish(writer.root)
+
+    def remove(self, key, value):
+        with self._write_lock:
+            if self.root is None:
+                return False
+            writer = _PathCopyingWriter(self, self.root)
+            removed = writer.remove(key, value)
+            if removed:
+                self._publish(writer.root)
+            return removed
+
+    def delete(self, key):
+        with self._write_lock:
+            if self.root is None:
+                return False
+            writer = _PathCopyingWriter(self, self.root)
+            deleted = writer.delete(key)
+            if deleted:
+                self._publish(writer.root)
+            return deleted
+
+    def delete_range(self, key_start, key_end):
+        with self._write_lock:
+            writer = _PathCopyingWriter(self, self.root)
+            deleted = writer.delete_range(key_start, key_end)
+            if deleted:
+                self._publish(writer.root)
+            return deleted
+
+    def delete_many(self, keys):
+        with self._write_lock:
+            writer = _PathCopyingWriter(self, self.root)
+            deleted = writer.delete_many(keys)
+            if deleted:
+                self._publish(writer.root)
+            return deleted
+
+    def bulk_load(self, collection, dense=True, presorted=False, fill_factor=None):
+        with self._write_lock:
+            if self.with_values:
+                keys = list(collection) if presorted else sorted(collection, key=itemgetter(0))
+                existing = list(self.snapshot().items()) if self.root is not None else []
+                keys = merge(existing, keys, key=itemgetter(0)) if existing else keys
+            else:
+                keys = list(collection) if presorted else sorted(collection)
+                existing = list(self.snapshot().cursor())
+                keys = merge(existing, keys) if existing else keys
+            writer = _PathCopyingWriter(self, None)
+            writer.bulk_load(keys, dense, True, fill_factor)
+            self._publish(writer.root)
+
+    def range_search(self, key_start, key_end):
+        return self.snapshot().range_search(key_start, key_end)
+
+    def cursor(self, key_start=None, key_end=None, reverse=False, offset=0, limit=None):
+        return self.snapshot().cursor(key_start, key_end, reverse, offset, limit)
+
+    def search_many(self, keys):
+        return self.snapshot().search_many(keys)
+
+    def get(self, key):
+        return self.snapshot().get(key)
+
+    def items(self, key_start=None, key_end=None):
+        return self.snapshot().items(key_start, key_end)
+
+    def range_search_many(self, ranges):
+        return self.snapshot().range_search_many(ranges)
+
+    def _publish(self, root):
+        self._head = (root, self._head[1] + 1)
@@ -0,0 +1,260 @@
+import mmap
+import os
+import struct
+from collections.abc import Mapping
+from itertools import islice
+from urllib.parse import quote, unquote
+from Join_based_on_hashing import StorageManager
+
+MAGIC = b'JOINBLK1'
+FILE_HEADER = struct.Struct('<8sIH')  # magic, block size, schema length; the schema follows
+BLOCK_HEADER = struct.Struct('<H')  # tuple count
+SUFFIX = '.blk'
+
+
+def _field_code(value):
+    """Returns the schema code of a tuple field: 'q' int64, 'd' float64 or 's' length-prefixed UTF-8."""
+    if isinstance(value, str):
+        return 's'
+    if isinstance(value, float):
+        return 'd'
+    if isinstance(value, int):
+        return 'q'
+    raise TypeError(f"cannot store a field of type {type(value).__name__} in a block file")
+
+
+class BlockFile:
+    """The blocks of one relation or bucket, stored in a file of fixed-size pages.
+    The first page holds the header: the block size and the schema, one code per tuple field.
+    Every other page holds one block of struct-packed tuples. String fields are stored as a
+    length in the packed part, followed by their bytes. Blocks are appended through a buffered
+    file and read back through mmap.
+    :param path: The block file.
+    :param block_size: The page size in bytes of a new file; an existing file keeps its own.
+    """
+    def __init__(self, path, block_size):
+        self.path = path
+        self.block_size = block_size
+        self.schema = None
+        self.num_blocks = 0
+        self.writer = None
+        self.reader = None
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as file:
+                magic, self.block_size, schema_length = FILE_HEADER.unpack(file.read(FILE_HEADER.size))
+                if magic != MAGIC:
+                    raise ValueError(f"{path} is not a block file")
+                self._set_schema(file.read(schema_length).decode())
+            self.num_blocks = os.path.getsize(path) // self.block_size - 1
+
+    def __len__(self):
+        return self.num_blocks
+
+    def __iter__(self):
+        """Yields the blocks in the order they were written, each a list of tuples."""
+        num_blocks = self.num_blocks
+        if not num_blocks:
+            return
+        if self.writer is not None:
+            self.writer.flush()
+        with open(self.path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for i in range(1, num_blocks + 1):
+                yield self._decode(mm, i * self.block_size)
+
+    def __getitem__(self, index):
+        """Returns one block, read through a mapping of the file that is kept until the next append."""
+        if not 0 <= index < self.num_blocks:
+            raise IndexError(f"block {index} of {self.path} does not exist")
+        if self.reader is None:
+            if self.writer is not None:
+                self.writer.flush()
+            with open(self.path, 'rb') as file:
+                self.reader = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._decode(self.reader, (index + 1) * self.block_size)
+
+    def append(self, blocks):
+        """Appends blocks, each a non-empty list of tuples that fits in one page."""
+        for block in blocks:
+            if self.writer is None:
+                self._open_writer(block[0])
+            self.writer.write(self._encode(block))
+            self.num_blocks += 1
+            self._close_reader()
+
+    def close(self):
+        """Flushes and closes the append buffer. Later appends open it again."""
+        self._close_reader()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def remove(self):
+        """Closes the file and deletes it from disk."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.num_blocks = 0
+
+    def _close_reader(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+    def _open_writer(self, record):
+        self.writer = open(self.path, 'ab', buffering=self.block_size * 64)
+        if self.schema is None:
+            schema = ''.join(_field_code(value) for value in record)
+            self._set_schema(schema)
+            header = FILE_HEADER.pack(MAGIC, self.block_size, len(schema)) + schema.encode()
+            self.writer.write(header.ljust(self.block_size, b'\0'))
+
+    def _set_schema(self, schema):
+        self.schema = schema
+        self.record = struct.Struct('<' + ''.join('H' if code == 's' else code for code in schema))
+        self.strings = [i for i, code in enumerate(schema) if code == 's']
+
+    def _encode(self, block):
+        pack, strings = self.record.pack, self.strings
+        parts = [BLOCK_HEADER.pack(len(block))]
+        try:
+            for record in block:
+                if strings:
+                    fields = list(record)
+                    encoded = []
+                    for i in strings:
+                        data = record[i].encode()
+                        fields[i] = len(data)
+                        encoded.append(data)
+                    parts.append(pack(*fields))
+                    parts.extend(encoded)
+                else:
+                    parts.append(pack(*record))
+        except (struct.error, AttributeError, IndexError) as error:
+            raise TypeError(f"{record} does not match the schema {self.schema!r} of {self.path}") from error
+        page = b''.join(parts)
+        if len(page) > self.block_size:
+            raise ValueError(f"a block of {len(block)} tuples takes {len(page)} bytes, "
+                             f"more than the block size of {self.block_size}")
+        return page.ljust(self.block_size, b'\0')
+
+    def _decode(self, mm, offset):
+        unpack_from, size, strings = self.record.unpack_from, self.record.size, self.strings
+        count, = BLOCK_HEADER.unpack_from(mm, offset)
+        offset += BLOCK_HEADER.size
+        block = []
+        for _ in range(count):
+            record = unpack_from(mm, offset)
+            offset += size
+            if strings:
+                record = list(record)
+                for i in strings:
+                    end = offset + record[i]
+                    record[i] = mm[offset:end].decode()
+                    offset = end
+                record = tuple(record)
+            block.append(record)
+        return block
+
+
+class BlockStore(Mapping):
+    """Maps relation and bucket keys to their BlockFile in a directory, the way StorageManager.disk
+    maps them to lists of blocks. Block files already in the directory are opened, so relations
+    written by an earlier run can be joined again without being loaded.
+    :param directory: The directory of the block files, created if it does not exist.
+    :param block_size: The page size in bytes of new block files.
+    """
+    def __init__(self, directory, block_size):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.block_size = block_size
+        self.files = {}
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(SUFFIX):
+                self.files[unquote(name[:-len(SUFFIX)])] = BlockFile(os.path.join(directory, name), block_size)
+
+    def __getitem__(self, key):
+        return self.files[key]
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def __len__(self):
+        return len(self.files)
+
+    def open(self, key):
+        """Returns the block file of key, creating an empty one if there is none yet."""
+        file = self.files.get(key)
+        if file is None:
+            path = os.path.join(self.directory, quote(str(key), safe='') + SUFFIX)
+            file = self.files[key] = BlockFile(path, self.block_size)
+        return file
+
+    def pop(self, key, *default):
+        """Deletes the block file of key, like dict.pop.
+        :return: The removed BlockFile, now empty, or default if there is no file for key.
+        """
+        file = self.files.pop(key, None)
+        if file is None:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        file.remove()
+        return file
+
+    def close(self):
+        """Flushes and closes the append buffers of all block files."""
+        for file in self.files.values():
+            file.close()
+
+
+class FileStorageManager(StorageManager):
+    """A StorageManager whose disk is a directory with one block file per relation or bucket,
+    instead of a dict of lists held in RAM. Only the blocks in `memory` and the append buffers
+    stay in memory, so relations larger than RAM can be partitioned and joined.
+    io_count counts the blocks actually written and read. A trailing partial block therefore
+    counts as a write here, where StorageManager leaves it out.
+    """
+    def __init__(self, num_blocks, tuples_per_block, directory, block_size=4096, replacement=None):
+        """Open the block files in directory, or start an empty one.
+        :param num_blocks: The number of blocks M that fit in memory.
+        :param tuples_per_block: The number of tuples written to each block.
+        :param directory: The directory holding the block files.
+        :param block_size: The page size in bytes; tuples_per_block tuples must fit in one page.
+        :param replacement: The replacement policy of a buffer pool, see StorageManager.
+        """
+        super().__init__(num_blocks, tuples_per_block, replacement)
+        self.disk = BlockStore(directory, block_size)
+
+    def write_to_disk(self, key, data):
+        """Appends data to the file of key, tuples_per_block tuples per block.
+        data may be any iterable of tuples, so a relation can be written from a generator in one call.
+        """
+        data = iter(data)
+        blocks = iter(lambda: list(islice(data, self.tuples_per_block)), [])
+        file = self.disk.open(key)
+        written = file.num_blocks
+        file.append(blocks)
+        self.io_count += file.num_blocks - written
+        if self.tracer is not None:
+            for index in range(written, file.num_blocks):
+                self.tracer.record('writes', key, index)
+
+    def _write_block(self, page_id, block):
+        key, index = page_id
+        file = self.disk.open(key)
+        if index != file.num_blocks:
+            raise ValueError(f"block {index} of {key} is written out of order, {file.num_blocks} blocks are on disk")
+        file.append([block])
+        self.io_count += 1
+        if self.tracer is not None:
+            self.tracer.record('writes', key, index)
+
+    def close(self):
+        """Flushes the block files. The files stay in the directory for a later run."""
+        self.disk.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
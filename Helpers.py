@@ -1,6 +1,19 @@
+import csv
+import gc
+import json
+import math
 import os
+import platform
 import random
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from itertools import accumulate, product
 from B_plus_tree_refactored import BPlusTree
 
 def generate_records(num_records, min_key, max_key):
@@ -8,6 +21,10 @@ def generate_records(num_records, min_key, max_key):
 
 def test_operations(num_records=10000, tree_orders=[13, 24], num_test_keys=100, 
                     start_record = 100000, end_record = 200000):
+    """Walks through a few inserts, deletes and searches on dense and sparse trees and logs every
+    tree before and after each update. The dumps dominate its run time, so use benchmark_suite
+    for timings and compare_tree_stats for tree shapes.
+    """
     # Setting up directories for logs
     base_log_dir = "logs"
     timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
@@ -24,8 +41,8 @@ def test_operations(num_records=10000, tree_orders=[13, 24], num_test_keys=100,
     for order in tree_orders:
         trees[f'dense_order_{order}'] = BPlusTree(order)
         trees[f'sparse_order_{order}'] = BPlusTree(order)
-        trees[f'dense_order_{order}'].build_tree(records, dense=True)
-        trees[f'sparse_order_{order}'].build_tree(records, dense=False)
+        trees[f'dense_order_{order}'].build_tree(records, dense=True, bulk=True)
+        trees[f'sparse_order_{order}'].build_tree(records, dense=False, bulk=True)
 
     test_keys = random.sample(range(start_record, end_record), num_test_keys)  # Ensure there are enough keys
 
@@ -86,8 +103,962 @@ def test_operations(num_records=10000, tree_orders=[13, 24], num_test_keys=100,
 
 def display_tree(node, file, level=0):
     if node.is_leaf:
-        file.write('  ' * level + f"Leaf: {node.keys}\n")
+        file.write('  ' * level + f"Leaf: {list(node.keys)}\n")
     else:
-        file.write('  ' * level + f"Internal: {node.keys}\n")
+        file.write('  ' * level + f"Internal: {list(node.keys)}\n")
     for child in node.children:
-        display_tree(child, file, level + 1)
\ No newline at end of file
+        display_tree(child, file, level + 1)
+
+def benchmark_scaling(record_counts=[10**4, 10**5, 10**6], tree_orders=[13, 24], num_ops=1000, dense=True):
+    """Times insert and delete cost per key as the tree grows, for every order.
+    With O(height) parent lookups the per-key cost should only grow logarithmically
+    with the number of records.
+    :return: A list of dicts, one per (record count, order) pair, with microseconds per key.
+    """
+    results = []
+    print(f"{'records':>10} {'order':>6} {'build us/key':>13} {'insert us/op':>13} {'delete us/op':>13}")
+    for num_records in record_counts:
+        records = generate_records(num_records + num_ops, 0, 10 * (num_records + num_ops))
+        base, extra = records[:num_records], records[num_records:]
+        for order in tree_orders:
+            tree = BPlusTree(order)
+            start = time.perf_counter()
+            tree.build_tree(base, dense=dense)
+            build_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for key in extra:
+                tree.insert(key, dense)
+            insert_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for key in extra:
+                tree.delete(key)
+            delete_time = time.perf_counter() - start
+
+            row = {'records': num_records, 'order': order,
+                   'build_us_per_key': 1e6 * build_time / num_records,
+                   'insert_us_per_op': 1e6 * insert_time / num_ops,
+                   'delete_us_per_op': 1e6 * delete_time / num_ops}
+            results.append(row)
+            print(f"{num_records:>10} {order:>6} {row['build_us_per_key']:>13.2f} "
+                  f"{row['insert_us_per_op']:>13.2f} {row['delete_us_per_op']:>13.2f}")
+    return results
+
+def leaf_keys(tree):
+    """Returns every key of the tree in leaf-chain order."""
+    return list(tree.cursor())
+
+def validate_bulk_load(num_records=100000, tree_orders=[13, 24], num_test_keys=1000,
+                       start_record=0, end_record=10**7):
+    """Builds each tree by repeated insert and by bulk load, checks both answer every query
+    the same way and prints how long each build took.
+    :return: True if every pair of trees agreed.
+    """
+    records = generate_records(num_records, start_record, end_record)
+    probes = random.sample(range(start_record, end_record), num_test_keys)
+    all_match = True
+    for order in tree_orders:
+        for dense in (True, False):
+            inserted, bulk = BPlusTree(order), BPlusTree(order)
+            start = time.perf_counter()
+            inserted.build_tree(records, dense=dense)
+            insert_time = time.perf_counter() - start
+            start = time.perf_counter()
+            bulk.build_tree(records, dense=dense, bulk=True)
+            bulk_time = time.perf_counter() - start
+
+            match = leaf_keys(inserted) == leaf_keys(bulk)
+            match = match and all(inserted.search(key) == bulk.search(key) for key in probes + records[:num_test_keys])
+            for low, high in zip(sorted(probes)[::2], sorted(probes)[1::2]):
+                match = match and inserted.range_search(low, high) == bulk.range_search(low, high)
+            all_match = all_match and match
+            kind = 'dense' if dense else 'sparse'
+            print(f"order {order} {kind}: insert build {insert_time:.3f}s, bulk build {bulk_time:.3f}s, "
+                  f"results {'match' if match else 'DIFFER'}")
+    return all_match
+
+def test_duplicate_keys(tree_orders=[3, 4, 5], num_runs=200, num_ops=200, num_distinct=8, seed=0):
+    """Runs random inserts, deletes, delete_many and delete_range calls on trees holding many
+    duplicate keys, and checks search, range_search and the return values of the deletes
+    against a Counter of the keys after every operation. Starts with the smallest case that
+    used to fail: after insert(3), insert(0), insert(0), delete(0), search(0) returned False.
+    :return: True if every check passed.
+    """
+    tree = BPlusTree(3)
+    for key in (3, 0, 0):
+        tree.insert(key)
+    tree.delete(0)
+    passed = tree.search(0) and tree.delete(0) and not tree.search(0) and tree.delete_many([0]) == 0
+    rng = random.Random(seed)
+    for run in range(num_runs):
+        order = tree_orders[run % len(tree_orders)]
+        tree, expected = BPlusTree(order), Counter()
+        for _ in range(num_ops):
+            key = rng.randrange(num_distinct)
+            operation = rng.random()
+            if operation < 0.5:
+                tree.insert(key)
+                expected[key] += 1
+            elif operation < 0.7:
+                passed = passed and tree.delete(key) == (expected[key] > 0)
+                expected[key] -= 1
+            elif operation < 0.85:
+                keys = [rng.randrange(num_distinct) for _ in range(rng.randrange(5))]
+                remaining = expected.copy()
+                remaining.subtract(keys)
+                deleted = sum(min(count, expected[key]) for key, count in Counter(keys).items())
+                passed = passed and tree.delete_many(keys) == deleted
+                expected = remaining
+            else:
+                high = key + rng.randrange(3)
+                tree.delete_range(key, high)
+                for removed in range(key, high + 1):
+                    expected[removed] = 0
+            expected = +expected
+            passed = passed and all(tree.search(probe) == (probe in expected) for probe in range(num_distinct))
+            passed = passed and tree.range_search(0, num_distinct) == sorted(expected.elements())
+        if not passed:
+            print(f"order {order}, run {run}: FAILED")
+            return False
+    print(f"{num_runs} runs of {num_ops} operations on duplicate keys: all checks passed")
+    return passed
+
+def memory_per_key(record_counts=[10**6, 10**7], tree_orders=[13, 24], dense=True):
+    """Reports estimated bytes per key of the default and compact node layouts.
+    Trees are bulk-loaded from sequential integer keys so that both layouts hold identical shapes.
+    :return: A list of dicts, one per (record count, order) pair.
+    """
+    results = []
+    print(f"{'records':>10} {'order':>6} {'default B/key':>14} {'compact B/key':>14}")
+    for num_records in record_counts:
+        for order in tree_orders:
+            row = {'records': num_records, 'order': order}
+            for compact in (False, True):
+                tree = BPlusTree(order, compact=compact)
+                tree.bulk_load(range(num_records), dense=dense, presorted=True)
+                total, num_keys = tree.memory_usage()
+                row['compact' if compact else 'default'] = total / num_keys
+                del tree
+            results.append(row)
+            print(f"{num_records:>10} {order:>6} {row['default']:>14.1f} {row['compact']:>14.1f}")
+    return results
+
+def benchmark_batch_lookups(num_records=10**6, order=24, batch_sizes=[100, 10000, 100000], scan_limit=500):
+    """Compares per-key search with search_many, and a full range_search with a limited cursor.
+    :return: A dict of timings in seconds.
+    """
+    tree = BPlusTree(order)
+    tree.build_tree(range(0, 2 * num_records, 2), bulk=True, presorted=True)
+    results = {}
+    for batch_size in batch_sizes:
+        probes = [random.randrange(2 * num_records) for _ in range(batch_size)]
+        start = time.perf_counter()
+        single = [tree.search(key) for key in probes]
+        single_time = time.perf_counter() - start
+        start = time.perf_counter()
+        batched = tree.search_many(probes)
+        batch_time = time.perf_counter() - start
+        assert single == batched
+        results[f'search_{batch_size}'] = single_time
+        results[f'search_many_{batch_size}'] = batch_time
+        print(f"{batch_size} probes: search {single_time:.4f}s, search_many {batch_time:.4f}s")
+
+    start = time.perf_counter()
+    first = tree.range_search(0, 2 * num_records)[:scan_limit]
+    results['range_search'] = time.perf_counter() - start
+    start = time.perf_counter()
+    limited = list(tree.cursor(0, 2 * num_records, limit=scan_limit))
+    results['cursor'] = time.perf_counter() - start
+    assert first == limited
+    print(f"first {scan_limit} keys of a full-range scan: range_search {results['range_search']:.4f}s, "
+          f"cursor {results['cursor']:.6f}s")
+    return results
+
+def stress_test_snapshots(num_readers=4, num_writes=20000, window=2000, order=24, check_every=50):
+    """Runs reader threads against a CopyOnWriteBPlusTree while a writer thread updates it.
+    The writer inserts keys in a random order and deletes each one again `window` inserts later,
+    so the contents of every version are known. Readers search random keys and regularly take a
+    snapshot and check that it matches its version exactly.
+    :return: A dict with read and write throughput and the number of inconsistent snapshots.
+    """
+    from Concurrent_B_plus_tree import CopyOnWriteBPlusTree
+    keys = random.sample(range(10 * num_writes), num_writes)
+    operations = []
+    for i, key in enumerate(keys):
+        operations.append(('insert', key))
+        if i >= window:
+            operations.append(('delete', keys[i - window]))
+    # The keys present after v operations are keys[deleted[v]:inserted[v]]
+    inserted, deleted = [0], [0]
+    for kind, _ in operations:
+        inserted.append(inserted[-1] + (kind == 'insert'))
+        deleted.append(deleted[-1] + (kind == 'delete'))
+
+    tree = CopyOnWriteBPlusTree(order)
+    done = threading.Event()
+    reads = [0] * num_readers
+    failures = [0] * num_readers
+
+    def reader(slot):
+        while not done.is_set():
+            for _ in range(check_every):
+                tree.search(random.choice(keys))
+            reads[slot] += check_every
+            snapshot = tree.snapshot()
+            expected = sorted(keys[deleted[snapshot.version]:inserted[snapshot.version]])
+            if list(snapshot.cursor()) != expected:
+                failures[slot] += 1
+
+    def writer():
+        for kind, key in operations:
+            if kind == 'insert':
+                tree.insert(key)
+            else:
+                tree.delete(key)
+
+    threads = [threading.Thread(target=reader, args=(slot,)) for slot in range(num_readers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    write_thread = threading.Thread(target=writer)
+    write_thread.start()
+    write_thread.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    for thread in threads:
+        thread.join()
+
+    results = {'readers': num_readers, 'writes': len(operations),
+               'writes_per_sec': len(operations) / elapsed,
+               'reads_per_sec': sum(reads) / elapsed,
+               'inconsistent_snapshots': sum(failures)}
+    print(f"{num_readers} readers: {results['writes_per_sec']:.0f} writes/s, "
+          f"{results['reads_per_sec']:.0f} reads/s, {results['inconsistent_snapshots']} inconsistent snapshots")
+    return results
+
+def benchmark_bulk_delete(num_records=10**6, order=24, range_fractions=[0.001, 0.01, 0.1, 0.5],
+                          batch_sizes=[1000, 100000]):
+    """Compares delete_range and delete_many against deleting the same keys one at a time.
+    Every pair of trees must end with identical contents.
+    :return: A list of dicts with the timings in seconds.
+    """
+    records = generate_records(num_records, 0, 10 * num_records)
+    ordered = sorted(records)
+    results = []
+
+    def build():
+        tree = BPlusTree(order)
+        tree.build_tree(records, bulk=True)
+        return tree
+
+    for fraction in range_fractions:
+        start_index = len(ordered) // 4
+        victims = ordered[start_index:start_index + int(fraction * num_records)]
+        per_key, batched = build(), build()
+        start = time.perf_counter()
+        for key in victims:
+            per_key.delete(key)
+        per_key_time = time.perf_counter() - start
+        start = time.perf_counter()
+        deleted = batched.delete_range(victims[0], victims[-1])
+        batch_time = time.perf_counter() - start
+        match = deleted == len(victims) and leaf_keys(per_key) == leaf_keys(batched)
+        results.append({'operation': 'delete_range', 'keys': len(victims), 'per_key': per_key_time,
+                        'batched': batch_time, 'match': match})
+        print(f"delete_range of {len(victims)} keys: per key {per_key_time:.3f}s, "
+              f"delete_range {batch_time:.4f}s, results {'match' if match else 'DIFFER'}")
+
+    for batch_size in batch_sizes:
+        victims = random.sample(records, batch_size)
+        per_key, batched = build(), build()
+        start = time.perf_counter()
+        for key in victims:
+            per_key.delete(key)
+        per_key_time = time.perf_counter() - start
+        start = time.perf_counter()
+        deleted = batched.delete_many(victims)
+        batch_time = time.perf_counter() - start
+        match = deleted == len(victims) and leaf_keys(per_key) == leaf_keys(batched)
+        results.append({'operation': 'delete_many', 'keys': batch_size, 'per_key': per_key_time,
+                        'batched': batch_time, 'match': match})
+        print(f"delete_many of {batch_size} keys: per key {per_key_time:.3f}s, "
+              f"delete_many {batch_time:.4f}s, results {'match' if match else 'DIFFER'}")
+    return results
+
+def compare_tree_stats(num_records=10000, tree_orders=[13, 24], num_test_keys=1000,
+                       start_record=100000, end_record=200000):
+    """Builds dense and sparse trees by repeated insert, as test_operations does, and prints their
+    shape and the work each operation does instead of dumping the trees.
+    :return: A dict mapping tree names to their stats and per-operation counts.
+    """
+    records = generate_records(num_records, start_record, end_record)
+    test_keys = random.sample(range(start_record, end_record), num_test_keys)
+    results = {}
+    for order in tree_orders:
+        for dense in (True, False):
+            name = f"{'dense' if dense else 'sparse'}_order_{order}"
+            tree = BPlusTree(order)
+            tree.enable_instrumentation()
+            tree.build_tree(records, dense=dense)
+            for key in test_keys:
+                tree.search(key)
+            for low, high in zip(sorted(test_keys)[::2], sorted(test_keys)[1::2]):
+                tree.range_search(low, high)
+            for key in records[:num_test_keys]:
+                tree.delete(key)
+            stats, counts = tree.stats(), tree.operation_counts()
+            results[name] = {'stats': stats, 'counts': counts}
+
+            print(f"\n{name}: height {stats['height']}, {stats['leaf_nodes']} leaves, "
+                  f"{stats['internal_nodes']} internal nodes, leaf fill {stats['leaf_fill']:.0%}, "
+                  f"internal fill {stats['internal_fill']:.0%}, {stats['bytes_per_key']:.1f} B/key")
+            print(f"  nodes per level: {[row['nodes'] for row in stats['levels']]}")
+            print(f"  leaf fill histogram (10% buckets): {stats['leaf_fill_histogram']}")
+            for operation, row in counts.items():
+                per_call = ', '.join(f"{event} {value:.2f}" for event, value in row['per_call'].items() if value)
+                print(f"  {operation} x{row['calls']}: {per_call}")
+    return results
+
+def generate_keys(distribution, num_keys, seed=None):
+    """Generates distinct integer keys in the order a workload would insert them.
+    :param distribution: 'sequential' (ascending, every other integer), 'random' (uniform over
+                         ten times as many integers) or 'clustered' (short ascending runs around
+                         random centres, visited in random order).
+    :param num_keys: The number of keys.
+    :param seed: Seed for the random generator, for repeatable runs.
+    """
+    rng = random.Random(seed)
+    if distribution == 'sequential':
+        return list(range(0, 2 * num_keys, 2))
+    if distribution == 'random':
+        return rng.sample(range(10 * num_keys), num_keys)
+    if distribution == 'clustered':
+        run = 100
+        starts = rng.sample(range(0, 10 * num_keys, 2 * run), -(-num_keys // run))
+        keys = [key for start in starts for key in range(start, start + run)]
+        return keys[:num_keys]
+    raise ValueError(f"Unknown key distribution: {distribution}")
+
+def time_operation(operation, repetitions=5, warmup=1, setup=None):
+    """Times a callable with the garbage collector paused, as timeit does.
+    :param operation: The callable to time.
+    :param repetitions: The number of timed runs.
+    :param warmup: The number of untimed runs first.
+    :param setup: Called untimed before every run, e.g. to restore the state the previous run changed.
+    :return: A list with the seconds each timed run took.
+    """
+    times = []
+    for run in range(warmup + repetitions):
+        if setup is not None:
+            setup()
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            operation()
+            elapsed = time.perf_counter() - start
+        finally:
+            if gc_enabled:
+                gc.enable()
+        if run >= warmup:
+            times.append(elapsed)
+    return times
+
+def benchmark_suite(record_counts=[10**3, 10**4, 10**5, 10**6, 10**7], tree_orders=[13, 24],
+                    modes=['dense', 'sparse'], distributions=['sequential', 'random', 'clustered'],
+                    num_ops=1000, range_width=100, repetitions=5, warmup=1, build_repetitions=1,
+                    bulk=False, output_dir="benchmarks", label="", seed=0):
+    """Times build, point search, range search, insert and delete separately for every combination
+    of record count, order, split mode and key distribution, and writes the results as JSON and CSV.
+    Unlike test_operations nothing is dumped while timing. Inserts and deletes are undone untimed
+    between runs, so every run starts from the same tree contents.
+    :param num_ops: The number of operations in one timed run of a point operation.
+    :param range_width: The number of keys each range search returns.
+    :param build_repetitions: Timed builds per combination; builds are not warmed up.
+    :param bulk: Build with bulk_load instead of repeated insert.
+    :param label: A free-form tag stored with the results, e.g. the version under test.
+    :return: A list of dicts, one per combination and operation.
+    """
+    rng = random.Random(seed)
+    results = []
+    print(f"{'records':>9} {'order':>5} {'mode':>6} {'distribution':>12} {'operation':>12} {'us/op':>10}")
+    for num_records in record_counts:
+        for distribution in distributions:
+            keys = generate_keys(distribution, num_records + num_ops, seed)
+            records, extra = keys[:num_records], keys[num_records:]
+            ordered = sorted(records)
+            probes = rng.sample(records, min(num_ops, num_records))
+            victims = rng.sample(records, min(num_ops, num_records))
+            starts = [rng.randrange(max(1, num_records - range_width)) for _ in range(num_ops)]
+            ranges = [(ordered[i], ordered[min(i + range_width, num_records) - 1]) for i in starts]
+            for order in tree_orders:
+                for mode in modes:
+                    dense = mode == 'dense'
+                    tree = None
+
+                    def build():
+                        nonlocal tree
+                        tree = BPlusTree(order)
+                        tree.build_tree(records, dense=dense, bulk=bulk)
+
+                    timings = {'build': (time_operation(build, build_repetitions, 0), num_records)}
+                    timings['search'] = (time_operation(lambda: [tree.search(key) for key in probes],
+                                                        repetitions, warmup), len(probes))
+                    timings['range_search'] = (time_operation(
+                        lambda: [tree.range_search(low, high) for low, high in ranges],
+                        repetitions, warmup), len(ranges))
+
+                    def insert_extra():
+                        for key in extra:
+                            tree.insert(key, dense)
+
+                    def remove_extra():
+                        if tree.search(extra[0]):
+                            for key in extra:
+                                tree.delete(key)
+
+                    def delete_victims():
+                        for key in victims:
+                            tree.delete(key)
+
+                    def restore_victims():
+                        if tree.search(victims[0]):
+                            return
+                        for key in victims:
+                            tree.insert(key, dense)
+
+                    timings['insert'] = (time_operation(insert_extra, repetitions, warmup, remove_extra),
+                                         len(extra))
+                    remove_extra()
+                    timings['delete'] = (time_operation(delete_victims, repetitions, warmup, restore_victims),
+                                         len(victims))
+
+                    for operation, (times, count) in timings.items():
+                        row = {'label': label, 'records': num_records, 'order': order, 'mode': mode,
+                               'distribution': distribution, 'bulk': bulk, 'operation': operation,
+                               'ops': count, 'repetitions': len(times),
+                               'min_s': min(times), 'median_s': statistics.median(times),
+                               'mean_s': statistics.mean(times),
+                               'us_per_op': 1e6 * statistics.median(times) / count}
+                        results.append(row)
+                        print(f"{num_records:>9} {order:>5} {mode:>6} {distribution:>12} "
+                              f"{operation:>12} {row['us_per_op']:>10.2f}")
+                    del tree
+
+    if output_dir:
+        write_benchmark_results(results, output_dir, {
+            'label': label, 'python': sys.version, 'platform': platform.platform(),
+            'num_ops': num_ops, 'range_width': range_width, 'repetitions': repetitions,
+            'warmup': warmup, 'seed': seed})
+    return results
+
+def write_benchmark_results(results, output_dir, metadata=None):
+    """Writes benchmark rows to a timestamped JSON file (with metadata) and CSV file.
+    :return: The paths of the JSON and CSV files.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+    json_path = os.path.join(output_dir, f"benchmark_{timestamp}.json")
+    csv_path = os.path.join(output_dir, f"benchmark_{timestamp}.csv")
+    with open(json_path, "w") as file:
+        json.dump({'metadata': metadata or {}, 'results': results}, file, indent=2)
+    with open(csv_path, "w", newline="") as file:
+        if results:
+            writer = csv.DictWriter(file, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+    print(f"Results written to {json_path} and {csv_path}")
+    return json_path, csv_path
+
+def compare_duplicate_storage(num_records=100000, num_distinct=1000, order=24):
+    """Indexes heavily repeated join keys once as bare duplicate keys and once as keys with row-id
+    posting lists, checks every posting list against a dict and prints the size of both trees.
+    :return: A dict with the stats of both trees.
+    """
+    records = [random.randrange(num_distinct) for _ in range(num_records)]
+    bare = BPlusTree(order)
+    indexed = BPlusTree(order, with_values=True)
+    start = time.perf_counter()
+    bare.build_tree(records)
+    bare_time = time.perf_counter() - start
+    start = time.perf_counter()
+    indexed.build_tree((key, row_id) for row_id, key in enumerate(records))
+    indexed_time = time.perf_counter() - start
+
+    expected = {}
+    for row_id, key in enumerate(records):
+        expected.setdefault(key, []).append(row_id)
+    match = all(indexed.get(key) == row_ids for key, row_ids in expected.items())
+    results = {'bare': bare.stats(), 'indexed': indexed.stats(), 'match': match}
+    for name, build_time in (('bare', bare_time), ('indexed', indexed_time)):
+        stats = results[name]
+        print(f"{name}: build {build_time:.3f}s, height {stats['height']}, {stats['leaf_nodes']} leaves, "
+              f"{stats['memory_bytes'] / num_records:.1f} B/record")
+    print(f"posting lists {'match' if match else 'DIFFER'}")
+    return results
+
+def generate_string_keys(dataset, num_keys, seed=None):
+    """Generates distinct string keys in random order.
+    :param dataset: 'payload' for join payload values such as 'data1' and 'info1', suffixed with a
+                    row number, or 'url' for product URLs sharing long prefixes.
+    :param num_keys: The number of keys.
+    :param seed: Seed for the random generator, for repeatable runs.
+    """
+    rng = random.Random(seed)
+    if dataset == 'payload':
+        keys = [f"{rng.choice(['data', 'info'])}{rng.randint(1, 3)}_{i}" for i in range(num_keys)]
+    elif dataset == 'url':
+        categories = ['books', 'electronics', 'garden', 'kitchen', 'toys', 'sports']
+        keys = [f"https://www.example.com/catalog/{rng.choice(categories)}/item/{i:08d}?ref=search"
+                for i in range(num_keys)]
+    else:
+        raise ValueError(f"Unknown string key dataset: {dataset}")
+    rng.shuffle(keys)
+    return keys
+
+def benchmark_string_keys(num_records=10**5, tree_orders=[13, 24, 64], datasets=['payload', 'url'],
+                          num_probes=10000):
+    """Compares plain and compress_keys trees on string keys: bytes per key, height and
+    point search latency, for trees built by repeated insert.
+    :return: A list of dicts, one per (dataset, order, mode).
+    """
+    results = []
+    print(f"{'dataset':>8} {'order':>6} {'mode':>10} {'B/key':>8} {'height':>7} {'search us':>10}")
+    for dataset in datasets:
+        keys = generate_string_keys(dataset, num_records, seed=0)
+        probes = random.sample(keys, min(num_probes, num_records))
+        for order in tree_orders:
+            for compress in (False, True):
+                tree = BPlusTree(order, compress_keys=compress)
+                tree.build_tree(keys)
+                times = time_operation(lambda: [tree.search(key) for key in probes], repetitions=5)
+                stats = tree.stats()
+                row = {'dataset': dataset, 'order': order, 'mode': 'compressed' if compress else 'plain',
+                       'bytes_per_key': stats['bytes_per_key'], 'height': stats['height'],
+                       'search_us': 1e6 * statistics.median(times) / len(probes)}
+                results.append(row)
+                print(f"{dataset:>8} {order:>6} {row['mode']:>10} {row['bytes_per_key']:>8.1f} "
+                      f"{row['height']:>7} {row['search_us']:>10.2f}")
+                del tree
+    return results
+
+def benchmark_sharded(num_records=10**6, order=24, shard_counts=[2, 4], num_probes=10**5,
+                      num_ranges=100, range_width=10**4):
+    """Compares one BPlusTree with ShardedBPlusTree on batched point lookups and range queries.
+    Every sharded answer must equal the single tree's answer.
+    :return: A list of dicts with the timings in seconds.
+    """
+    from Sharded_B_plus_tree import ShardedBPlusTree
+    keys = list(range(0, 2 * num_records, 2))
+    probes = [random.randrange(2 * num_records) for _ in range(num_probes)]
+    starts = [random.randrange(2 * num_records) for _ in range(num_ranges)]
+    ranges = [(start, start + 2 * range_width) for start in starts]
+
+    tree = BPlusTree(order)
+    tree.bulk_load(keys, presorted=True)
+    start = time.perf_counter()
+    expected_found = tree.search_many(probes)
+    single_search = time.perf_counter() - start
+    start = time.perf_counter()
+    expected_ranges = tree.range_search_many(ranges)
+    single_range = time.perf_counter() - start
+    results = [{'shards': 1, 'search_many': single_search, 'range_search_many': single_range, 'match': True}]
+    print(f"1 tree: search_many {single_search:.3f}s, range_search_many {single_range:.3f}s")
+    del tree
+
+    for num_shards in shard_counts:
+        with ShardedBPlusTree(order, num_shards=num_shards) as sharded:
+            sharded.bulk_load(keys, presorted=True)
+            start = time.perf_counter()
+            found = sharded.search_many(probes)
+            search_time = time.perf_counter() - start
+            start = time.perf_counter()
+            found_ranges = sharded.range_search_many(ranges)
+            range_time = time.perf_counter() - start
+        match = found == expected_found and found_ranges == expected_ranges
+        results.append({'shards': num_shards, 'search_many': search_time, 'range_search_many': range_time,
+                        'match': match})
+        print(f"{num_shards} shards: search_many {search_time:.3f}s, range_search_many {range_time:.3f}s, "
+              f"results {'match' if match else 'DIFFER'}")
+    return results
+
+
+def compare_replacement_policies(num_tuples=1000, memory_sizes=[5, 15, 40], policies=['lru', 'mru', 'clock'],
+                                 tuples_per_block=8):
+    """Runs the hybrid hash join within M blocks of buffer pool, under each replacement policy and M.
+    The first run of every M uses no buffer pool and gives the reference result and I/O count.
+    :return: A list of dicts with the I/O count and the buffer pool counters of every run.
+    """
+    from Join_based_on_hashing import StorageManager, generate_relation_s, hybrid_hash_join
+    relation_s = generate_relation_s(5000)
+    relation_r = [(random.choice(['info1', 'info2', 'info3']), b) for b, c in random.sample(relation_s, num_tuples)]
+    results = []
+    for num_blocks in memory_sizes:
+        expected = None
+        for policy in [None] + policies:
+            storage = StorageManager(num_blocks, tuples_per_block, replacement=policy)
+            storage.write_to_disk('relation_s', relation_s)
+            storage.write_to_disk('relation_r', relation_r)
+            try:
+                joined, report = hybrid_hash_join(storage)
+            except RuntimeError as error:
+                print(f"M={num_blocks} {policy}: {error}")
+                continue
+            joined = Counter(joined)
+            expected = joined if expected is None else expected
+            stats = storage.pool_stats() or {}
+            results.append({'num_blocks': num_blocks, 'policy': policy or 'none', 'io': report['io'],
+                            'match': joined == expected, **stats})
+            print(f"M={num_blocks} {policy or 'no pool'}: {report['io']} I/Os, "
+                  f"{stats.get('hits', 0)} hits, {stats.get('evictions', 0)} evictions, "
+                  f"results {'match' if joined == expected else 'DIFFER'}")
+    return results
+
+
+def benchmark_parallel_join(num_tuples=10**6, worker_counts=None, num_blocks=101, tuples_per_block=100):
+    """Times parallel_two_pass_join from 1 worker up to the number of cores.
+    R holds num_tuples tuples joining S, which holds twice as many. Every run must return the
+    1-worker result and count the same I/O.
+    :param worker_counts: The worker counts to time, 1, 2, 4, ... up to os.cpu_count() by default.
+    :return: A list of dicts with the time in seconds and the speedup over 1 worker.
+    """
+    from Join_based_on_hashing import StorageManager, generate_relation_s, parallel_two_pass_join
+    if worker_counts is None:
+        cores = os.cpu_count() or 1
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= cores:
+            worker_counts.append(worker_counts[-1] * 2)
+        if worker_counts[-1] != cores:
+            worker_counts.append(cores)
+    relation_s = generate_relation_s(2 * num_tuples)
+    relation_r = [(random.choice(['info1', 'info2', 'info3']), b) for b, c in random.sample(relation_s, num_tuples)]
+    results = []
+    expected = None
+    for num_workers in worker_counts:
+        storage = StorageManager(num_blocks, tuples_per_block)
+        storage.write_to_disk('relation_s', relation_s)
+        storage.write_to_disk('relation_r', relation_r)
+        io_start = storage.io_count
+        start = time.perf_counter()
+        joined = parallel_two_pass_join(storage, num_workers=num_workers)
+        elapsed = time.perf_counter() - start
+        io = storage.io_count - io_start
+        if expected is None:
+            expected = (joined, io)
+        match = (joined, io) == expected
+        speedup = results[0]['seconds'] / elapsed if results else 1.0
+        results.append({'workers': num_workers, 'seconds': elapsed, 'speedup': speedup, 'io': io, 'match': match})
+        print(f"{num_workers} workers: {elapsed:.3f}s, speedup {speedup:.2f}x, {io} I/Os, "
+              f"results {'match' if match else 'DIFFER'}")
+    return results
+
+
+def benchmark_columnar_partitioning(num_tuples=10**6, memory_sizes=[16, 101, 1001], tuples_per_block=100,
+                                    repetitions=3):
+    """Times StorageManager.hash_and_partition against hash_and_partition_columnar, which needs NumPy.
+    Both must produce the same buckets and io_count.
+    :return: A list of dicts with the best time in seconds of each path.
+    """
+    from Join_based_on_hashing import StorageManager, hash_function
+    relation = [(random.randint(0, 10**9), random.choice(['data1', 'data2', 'data3'])) for _ in range(num_tuples)]
+    results = []
+    for num_blocks in memory_sizes:
+        timings = {}
+        outcomes = {}
+        for path in ['hash_and_partition', 'hash_and_partition_columnar']:
+            storages = []
+
+            def setup():
+                storage = StorageManager(num_blocks, tuples_per_block)
+                storage.write_to_disk('relation', relation)
+                storages.append((storage, storage.io_count))
+
+            if path == 'hash_and_partition':
+                operation = lambda: storages[-1][0].hash_and_partition('relation', hash_function)
+            else:
+                operation = lambda: storages[-1][0].hash_and_partition_columnar('relation')
+            timings[path] = min(time_operation(operation, repetitions, warmup=0, setup=setup))
+            storage, io_start = storages[-1]
+            outcomes[path] = (storage.disk, storage.io_count - io_start)
+        match = outcomes['hash_and_partition'] == outcomes['hash_and_partition_columnar']
+        results.append({'num_blocks': num_blocks, 'loop': timings['hash_and_partition'],
+                        'columnar': timings['hash_and_partition_columnar'], 'match': match})
+        print(f"M={num_blocks}: loop {timings['hash_and_partition']:.3f}s, "
+              f"columnar {timings['hash_and_partition_columnar']:.3f}s, results {'match' if match else 'DIFFER'}")
+    return results
+
+
+def compare_join_algorithms(num_tuples=1000, memory_sizes=[5, 15, 40], heavy_fraction=0.5, tuples_per_block=8):
+    """Runs the two-pass hash join and the sort-merge join on a uniform and on a skewed R, where
+    heavy_fraction of the tuples share one key, and checks both results against pandas_join.
+    :return: A list of dicts with the measured and the estimated I/O of both joins.
+    """
+    import pandas as pd
+    from Join_based_on_hashing import StorageManager, generate_relation_s, iter_two_pass_join, pandas_join
+    from Join_based_on_sorting import estimate_join_costs, sort_merge_join
+    relation_s = generate_relation_s(5000)
+    heavy_key = relation_s[0][0]
+    uniform = [(random.choice(['info1', 'info2', 'info3']), b) for b, c in random.sample(relation_s, num_tuples)]
+    num_heavy = int(num_tuples * heavy_fraction)
+    skewed = [('info1', heavy_key)] * num_heavy + uniform[num_heavy:]
+    columns = ['A', 'B', 'C']
+    results = []
+    for name, relation_r in [('uniform', uniform), ('skewed', skewed)]:
+        expected = pandas_join(relation_r, relation_s).sort_values(columns).reset_index(drop=True)
+        for num_blocks in memory_sizes:
+            row = {'relation_r': name, 'num_blocks': num_blocks}
+            for algorithm, join in [('hash', lambda storage: list(iter_two_pass_join(storage))),
+                                    ('sort_merge', sort_merge_join)]:
+                storage = StorageManager(num_blocks, tuples_per_block)
+                storage.write_to_disk('relation_s', relation_s)
+                storage.write_to_disk('relation_r', relation_r)
+                if algorithm == 'hash':
+                    row.update({f"{key}_estimate": value for key, value in estimate_join_costs(storage).items()
+                                if key != 'skew'})
+                io_start = storage.io_count
+                joined = pd.DataFrame(join(storage), columns=columns).sort_values(columns).reset_index(drop=True)
+                row[f"{algorithm}_io"] = storage.io_count - io_start
+                row[f"{algorithm}_match"] = joined.equals(expected)
+            results.append(row)
+            choice = 'sort_merge' if row['sort_merge_estimate'] < row['hash_estimate'] else 'hash'
+            print(f"{name} R, M={num_blocks}: hash {row['hash_io']} I/Os (estimate {row['hash_estimate']}), "
+                  f"sort-merge {row['sort_merge_io']} I/Os (estimate {row['sort_merge_estimate']}), "
+                  f"model picks {choice}, results {'match' if row['hash_match'] and row['sort_merge_match'] else 'DIFFER'}")
+    return results
+
+
+def test_small_memory_joins(memory_sizes=[2, 3], num_tuples=200, heavy_fraction=0.5, tuples_per_block=8):
+    """Runs estimate_join_costs, cost_based_join and sort_merge_join with very few memory blocks, on a
+    uniform and on a skewed R built as in compare_join_algorithms, and checks both joins against
+    pandas_join. Below 3 blocks the sort-merge estimate must be infinite, so that the hash join is
+    picked. With 2 blocks, sort_merge_join and the sort-merge estimate used to loop forever.
+    :return: True if every check passed.
+    """
+    import pandas as pd
+    from Join_based_on_hashing import StorageManager, generate_relation_s, pandas_join
+    from Join_based_on_sorting import cost_based_join, estimate_join_costs, sort_merge_join
+    relation_s = generate_relation_s(1000)
+    uniform = [(random.choice(['info1', 'info2', 'info3']), b) for b, c in random.sample(relation_s, num_tuples)]
+    num_heavy = int(num_tuples * heavy_fraction)
+    skewed = [('info1', relation_s[0][0])] * num_heavy + uniform[num_heavy:]
+    columns = ['A', 'B', 'C']
+    passed = True
+    for name, relation_r in [('uniform', uniform), ('skewed', skewed)]:
+        expected = pandas_join(relation_r, relation_s).sort_values(columns).reset_index(drop=True)
+        for num_blocks in memory_sizes:
+            matches = {}
+            for algorithm, join in [('cost_based', lambda storage: cost_based_join(storage)[0]),
+                                    ('sort_merge', sort_merge_join)]:
+                storage = StorageManager(num_blocks, tuples_per_block)
+                storage.write_to_disk('relation_s', relation_s)
+                storage.write_to_disk('relation_r', relation_r)
+                if algorithm == 'cost_based':
+                    costs = estimate_join_costs(storage)
+                    valid = math.isfinite(costs['sort_merge']) == (num_blocks >= 3)
+                joined = pd.DataFrame(join(storage), columns=columns).sort_values(columns).reset_index(drop=True)
+                matches[algorithm] = joined.equals(expected)
+            passed = passed and valid and all(matches.values())
+            print(f"{name} R, M={num_blocks}: sort-merge estimate {costs['sort_merge']}, hash estimate "
+                  f"{costs['hash']}, cost-based join {'matches' if matches['cost_based'] else 'DIFFERS'}, "
+                  f"sort-merge join {'matches' if matches['sort_merge'] else 'DIFFERS'}")
+    return passed
+
+
+def benchmark_bloom_filter(num_tuples=10**5, value_ranges=[None, (10000, 20000), (40000, 90000)], num_blocks=101,
+                           tuples_per_block=100, false_positive_rate=0.01):
+    """Partitions R and then S for the two-pass join with and without a Bloom filter of R's join keys,
+    and reports the spilled bucket blocks, the I/O count and the time of the join phase.
+    R is built as in main_join.run_experiment: sampled from S, or drawn from value_range.
+    :return: A list of dicts with the measurements of every run.
+    """
+    from Join_based_on_hashing import BloomFilter, StorageManager, generate_relation_s, hash_function, hash_join_buckets
+    relation_s = generate_relation_s(5 * num_tuples)
+    results = []
+    for value_range in value_ranges:
+        if value_range:
+            relation_r = [(random.choice(['info1', 'info2', 'info3']), random.randint(*value_range))
+                          for _ in range(num_tuples)]
+        else:
+            relation_r = [(random.choice(['info1', 'info2', 'info3']), b) for b, c in random.sample(relation_s, num_tuples)]
+        runs = {}
+        for bloom in [False, True]:
+            storage = StorageManager(num_blocks, tuples_per_block)
+            storage.write_to_disk('relation_r', relation_r)
+            storage.write_to_disk('relation_s', relation_s)
+            io_start = storage.io_count
+            keys = BloomFilter(len(relation_r), false_positive_rate) if bloom else None
+            storage.hash_and_partition('relation_r', hash_function, 1, build_filter=keys)
+            storage.hash_and_partition('relation_s', hash_function, 0, probe_filter=keys)
+            spilled = sum(len(storage.disk.get(f"{relation}_bucket_{i}", []))
+                          for relation in ['relation_r', 'relation_s'] for i in range(num_blocks - 1))
+            start = time.perf_counter()
+            joined = sum(len(hash_join_buckets(storage.disk.get(f'relation_r_bucket_{i}', []),
+                                               storage.disk.get(f'relation_s_bucket_{i}', [])))
+                         for i in range(num_blocks - 1))
+            runs[bloom] = {'value_range': value_range, 'bloom_filter': bloom, 'spilled_blocks': spilled,
+                           'io': storage.io_count - io_start, 'join_seconds': time.perf_counter() - start,
+                           'results': joined}
+        without, with_filter = runs[False], runs[True]
+        results.extend([without, with_filter])
+        print(f"R from {value_range or 'S'}: spilled blocks {without['spilled_blocks']} -> {with_filter['spilled_blocks']}, "
+              f"I/O {without['io']} -> {with_filter['io']}, join phase {without['join_seconds']:.3f}s -> "
+              f"{with_filter['join_seconds']:.3f}s, results {'match' if without['results'] == with_filter['results'] else 'DIFFER'}")
+    return results
+
+
+def join_algorithms():
+    """Returns the joins benchmark_join_sweep can time, by name, each called with a StorageManager."""
+    from Join_based_on_hashing import hybrid_hash_join, iter_two_pass_join
+    from Join_based_on_sorting import iter_sort_merge_join
+    return {'two_pass': iter_two_pass_join,
+            'hybrid': lambda storage: hybrid_hash_join(storage)[0],
+            'sort_merge': iter_sort_merge_join}
+
+
+def generate_join_relations(r_tuples, s_tuples, skew='uniform', match_rate=1.0, zipf_exponent=1.1, seed=None):
+    """Generates R(A, B) and S(B, C) with integer join keys for join benchmarks.
+    S draws its keys from s_tuples distinct values, uniformly or with Zipf frequencies. A match_rate
+    share of R's tuples draws keys the same way, restricted to keys S holds; the others get keys
+    S does not hold.
+    :param skew: 'uniform' or 'zipf'.
+    :param match_rate: The share of R tuples that join with S, between 0 and 1.
+    :param zipf_exponent: The exponent of the Zipf distribution; the key of rank k is drawn with weight 1 / k ** exponent.
+    :return: A tuple (relation_r, relation_s).
+    """
+    rng = random.Random(seed)
+    domain = max(1, s_tuples)
+    if skew == 'uniform':
+        draw = lambda count: [rng.randrange(domain) for _ in range(count)]
+    elif skew == 'zipf':
+        cumulative = list(accumulate(1 / rank ** zipf_exponent for rank in range(1, domain + 1)))
+        draw = lambda count: rng.choices(range(domain), cum_weights=cumulative, k=count)
+    else:
+        raise ValueError(f"Unknown key skew: {skew}")
+    relation_s = [(key, rng.choice(['data1', 'data2', 'data3'])) for key in draw(s_tuples)]
+    present = {key for key, _ in relation_s}
+    num_matching = round(r_tuples * match_rate) if present else 0
+    keys = []
+    while len(keys) < num_matching:
+        keys.extend(key for key in draw(num_matching - len(keys)) if key in present)
+    keys.extend(domain + rng.randrange(domain) for _ in range(r_tuples - num_matching))
+    rng.shuffle(keys)
+    relation_r = [(rng.choice(['info1', 'info2', 'info3']), key) for key in keys]
+    return relation_r, relation_s
+
+
+def _run_join_config(config):
+    """Times one join configuration of benchmark_join_sweep; runs in a worker process."""
+    from Join_based_on_hashing import JoinDigest, StorageManager, iter_expected_join
+    relation_r, relation_s = generate_join_relations(config['r_tuples'], config['s_tuples'], config['skew'],
+                                                     config['match_rate'], config['zipf_exponent'], config['seed'])
+    expected = JoinDigest(iter_expected_join(relation_r, relation_s))
+    join = join_algorithms()[config['algorithm']]
+    # Only the current run is kept, so earlier runs' relations and buckets are freed before the next one
+    run = []
+
+    def setup():
+        run.clear()
+        storage = StorageManager(config['num_blocks'], config['tuples_per_block'])
+        storage.write_to_disk('relation_s', relation_s)
+        storage.write_to_disk('relation_r', relation_r)
+        run.append((storage, storage.io_count, JoinDigest()))
+
+    def operation():
+        storage, _, digest = run[0]
+        for record in join(storage):
+            digest.add(record)
+
+    times = time_operation(operation, config['repetitions'], config['warmup'], setup)
+    storage, io_start, digest = run.pop()
+    io = storage.io_count - io_start
+    del storage
+    tuples_per_block = config['tuples_per_block']
+    expected_io = 3 * (-(-len(relation_r) // tuples_per_block) + -(-len(relation_s) // tuples_per_block))
+    peak_memory = None
+    if config['measure_memory']:
+        setup()
+        tracemalloc.start()
+        try:
+            operation()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    median = statistics.median(times)
+    return {**{key: value for key, value in config.items() if key != 'measure_memory'},
+            'min_s': min(times), 'median_s': median,
+            'input_tuples_per_s': (len(relation_r) + len(relation_s)) / median if median else 0.0,
+            'results': digest.count, 'results_per_s': digest.count / median if median else 0.0,
+            'io': io, 'expected_io': expected_io,
+            'peak_memory_bytes': peak_memory, 'correct': digest == expected}
+
+
+def benchmark_join_sweep(algorithms=['two_pass'], memory_sizes=[15, 101], block_sizes=[8, 100],
+                         relation_sizes=[(1000, 5000), (10**5, 5 * 10**5)], skews=['uniform', 'zipf'],
+                         match_rates=[1.0, 0.1], zipf_exponent=1.1, repetitions=3, warmup=0, num_workers=None,
+                         measure_memory=True, output_dir="benchmarks", label="", seed=0):
+    """Times the joins of join_algorithms() for every combination of algorithm, memory size M, block size,
+    relation sizes, key skew and match rate, and writes the results as JSON and CSV.
+    Relations come from generate_join_relations. Nothing is plotted or logged while timing, and the
+    output is checked through its JoinDigest against iter_expected_join rather than kept. The
+    combinations run on a pool of worker processes; as they share the cores, run with num_workers=1
+    when the timings themselves are compared.
+    :param relation_sizes: (R tuples, S tuples) pairs.
+    :param num_workers: The number of worker processes, os.cpu_count() by default. With 1, all
+                        combinations run in this process.
+    :param measure_memory: Run every combination once more under tracemalloc for the peak bytes
+                           allocated by the join, which the timed runs leave out.
+    :param label: A free-form tag stored with the results, e.g. the version under test.
+    :return: A list of dicts, one per combination; see plot_join_sweep to chart them.
+    """
+    configs = [{'label': label, 'algorithm': algorithm, 'num_blocks': num_blocks, 'tuples_per_block': tuples_per_block,
+                'r_tuples': r_tuples, 's_tuples': s_tuples, 'skew': skew, 'match_rate': match_rate,
+                'zipf_exponent': zipf_exponent, 'seed': seed, 'repetitions': repetitions, 'warmup': warmup,
+                'measure_memory': measure_memory}
+               for algorithm, num_blocks, tuples_per_block, (r_tuples, s_tuples), skew, match_rate
+               in product(algorithms, memory_sizes, block_sizes, relation_sizes, skews, match_rates)]
+    num_workers = num_workers or os.cpu_count() or 1
+    print(f"{'algorithm':>10} {'M':>5} {'tpb':>5} {'R':>8} {'S':>8} {'skew':>7} {'match':>5} "
+          f"{'seconds':>9} {'I/O':>9} {'expected':>9} {'correct':>7}")
+    results = []
+    executor = ProcessPoolExecutor(num_workers) if num_workers > 1 else None
+    try:
+        rows = executor.map(_run_join_config, configs) if executor is not None else map(_run_join_config, configs)
+        for row in rows:
+            results.append(row)
+            print(f"{row['algorithm']:>10} {row['num_blocks']:>5} {row['tuples_per_block']:>5} {row['r_tuples']:>8} "
+                  f"{row['s_tuples']:>8} {row['skew']:>7} {row['match_rate']:>5} {row['median_s']:>9.3f} "
+                  f"{row['io']:>9} {row['expected_io']:>9} {str(row['correct']):>7}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if output_dir:
+        write_benchmark_results(results, output_dir, {
+            'label': label, 'benchmark': 'join_sweep', 'python': sys.version, 'platform': platform.platform(),
+            'num_workers': num_workers, 'repetitions': repetitions, 'warmup': warmup, 'seed': seed})
+    return results
+
+
+def plot_join_sweep(results, x='num_blocks', y='median_s', series='algorithm', path=None):
+    """Charts benchmark_join_sweep results after the fact, one line per value of series.
+    Rows that share x and series, e.g. different skews, are averaged.
+    :param results: The rows returned by benchmark_join_sweep, or the path of its CSV file.
+    :param path: Save the chart to this file instead of showing it.
+    """
+    import pandas as pd
+    import matplotlib.pyplot as plt
+    frame = pd.read_csv(results) if isinstance(results, str) else pd.DataFrame(results)
+    for name, group in frame.groupby(series):
+        means = group.groupby(x)[y].mean()
+        plt.plot(means.index, means.values, marker='o', label=f"{series}={name}")
+    plt.xlabel(x)
+    plt.ylabel(y)
+    plt.title(f"{y} by {x}")
+    plt.legend()
+    plt.tight_layout()
+    if path:
+        plt.savefig(path)
+        plt.close()
+    else:
+        plt.show()
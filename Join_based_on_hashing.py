@@ -1,38 +1,457 @@
+import math
+import os
 import random
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from hashlib import blake2b
+from itertools import chain, islice
+from operator import itemgetter
 import pandas as pd
 import matplotlib.pyplot as plt
+try:
+    import numpy as np
+except ImportError:  # Only hash_and_partition_columnar needs NumPy
+    np = None
 
 def generate_relation_s(num_tuples):
     """Generate a sample relation S with random values."""
     return [(random.randint(10000, 50000), random.choice(['data1', 'data2', 'data3'])) for _ in range(num_tuples)]
 
+class LRUPolicy:
+    """Evicts the least recently used unpinned page."""
+    def __init__(self):
+        self.order = OrderedDict()
+
+    def admit(self, page_id):
+        self.order[page_id] = None
+
+    def touch(self, page_id):
+        self.order.move_to_end(page_id)
+
+    def remove(self, page_id):
+        del self.order[page_id]
+
+    def victim(self, evictable):
+        """Returns the page to evict among those evictable accepts, or None if there is none."""
+        return next((page_id for page_id in self.order if evictable(page_id)), None)
+
+
+class MRUPolicy(LRUPolicy):
+    """Evicts the most recently used unpinned page. Repeated scans of an input larger than the pool
+    then keep its first blocks cached, where LRU would evict every block before it is read again."""
+    def victim(self, evictable):
+        return next((page_id for page_id in reversed(self.order) if evictable(page_id)), None)
+
+
+class ClockPolicy:
+    """Approximates LRU with a reference bit per frame. The hand sweeps the frames, clearing set bits,
+    and evicts the first unpinned page whose bit is already clear."""
+    def __init__(self):
+        self.slots = []
+        self.referenced = {}
+        self.hand = 0
+
+    def admit(self, page_id):
+        if None in self.slots:
+            self.slots[self.slots.index(None)] = page_id
+        else:
+            self.slots.append(page_id)
+        self.referenced[page_id] = True
+
+    def touch(self, page_id):
+        self.referenced[page_id] = True
+
+    def remove(self, page_id):
+        self.slots[self.slots.index(page_id)] = None
+        del self.referenced[page_id]
+
+    def victim(self, evictable):
+        for _ in range(2 * len(self.slots)):
+            page_id = self.slots[self.hand]
+            self.hand = (self.hand + 1) % len(self.slots)
+            if page_id is None or not evictable(page_id):
+                continue
+            if self.referenced[page_id]:
+                self.referenced[page_id] = False
+                continue
+            return page_id
+        return None
+
+
+REPLACEMENT_POLICIES = {'lru': LRUPolicy, 'mru': MRUPolicy, 'clock': ClockPolicy}
+
+
+class BufferPoolManager:
+    """Holds at most capacity blocks in frames, identified by page ids (disk key, block index).
+    Pinned pages are never evicted. Dirty pages are written back when they are evicted or flushed.
+    :param capacity: The number of frames.
+    :param read_block: Called with a page id on a miss, returns the block.
+    :param write_block: Called with a page id and its block when a dirty page is written back.
+    :param policy: 'lru', 'mru', 'clock', or an object with admit, touch, remove and victim methods.
+    """
+    def __init__(self, capacity, read_block, write_block, policy='lru'):
+        self.capacity = capacity
+        self.read_block = read_block
+        self.write_block = write_block
+        self.policy = REPLACEMENT_POLICIES[policy]() if isinstance(policy, str) else policy
+        self.frames = {}
+        self.pins = {}
+        self.dirty = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+
+    def pin(self, page_id):
+        """Returns the block of a page and pins it, reading it from disk on a miss."""
+        block = self.frames.get(page_id)
+        if block is not None:
+            self.hits += 1
+            self.policy.touch(page_id)
+        else:
+            self.misses += 1
+            self._make_room()
+            block = self.frames[page_id] = self.read_block(page_id)
+            self.policy.admit(page_id)
+        self.pins[page_id] = self.pins.get(page_id, 0) + 1
+        return block
+
+    def unpin(self, page_id, dirty=False):
+        """Releases one pin of a page, marking it dirty if the caller modified its block."""
+        count = self.pins[page_id] - 1
+        if count:
+            self.pins[page_id] = count
+        else:
+            del self.pins[page_id]
+        if dirty:
+            self.dirty.add(page_id)
+
+    def new_page(self, page_id, block, dirty=True):
+        """Admits a block that is not on disk yet as a pinned page."""
+        self._make_room()
+        self.frames[page_id] = block
+        self.pins[page_id] = 1
+        self.policy.admit(page_id)
+        if dirty:
+            self.dirty.add(page_id)
+
+    def flush(self, page_id=None):
+        """Writes back one dirty page, or all of them; the pages stay cached."""
+        for page_id in [page_id] if page_id is not None else list(self.dirty):
+            if page_id in self.dirty:
+                self.write_block(page_id, self.frames[page_id])
+                self.dirty.discard(page_id)
+                self.writes += 1
+
+    def drop(self, page_id):
+        """Forgets a page without writing it back."""
+        if page_id in self.frames:
+            del self.frames[page_id]
+            self.policy.remove(page_id)
+        self.pins.pop(page_id, None)
+        self.dirty.discard(page_id)
+
+    def discard(self, key):
+        """Forgets every page of a disk key, once its blocks are deleted."""
+        for page_id in [page_id for page_id in self.frames if page_id[0] == key]:
+            self.drop(page_id)
+
+    def free_frames(self):
+        """Returns the number of frames that are empty or hold an unpinned page."""
+        return self.capacity - len(self.pins)
+
+    def stats(self):
+        """Returns the hit, miss, eviction and write-back counters and the state of the frames."""
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'writes': self.writes,
+                'cached_pages': len(self.frames),
+                'pinned_pages': len(self.pins),
+                'dirty_pages': len(self.dirty)}
+
+    def _make_room(self):
+        if len(self.frames) < self.capacity:
+            return
+        page_id = self.policy.victim(lambda page_id: page_id not in self.pins)
+        if page_id is None:
+            raise RuntimeError(f"all {self.capacity} frames of the buffer pool are pinned")
+        self.evictions += 1
+        self.flush(page_id)
+        self.drop(page_id)
+
+
+class IOTracer:
+    """Records the block reads and writes of a StorageManager, kept separately for every phase of a join.
+    Every block is charged to the innermost phase running, 'other' outside of any, together with
+    its disk key and whether the access is sequential: the block right after the one touched by
+    the previous read or write, as a single disk head would see it, and random otherwise. Writes
+    that StorageManager.write_to_disk leaves out of io_count, the trailing partial blocks, are
+    recorded as uncounted writes. The wall-clock time spent in every phase is recorded as well;
+    for a generator such as iter_two_pass_join, it includes the time its consumer takes.
+    """
+    EVENTS = ('reads', 'writes', 'sequential', 'random', 'uncounted_writes')
+
+    def __init__(self):
+        self.totals = {}
+        self.keys = {}
+        self._running = []
+        self._last = None
+
+    def _counts(self, phase):
+        counts = self.totals.get(phase)
+        if counts is None:
+            counts = self.totals[phase] = dict.fromkeys(('calls', 'seconds') + self.EVENTS, 0)
+        return counts
+
+    @contextmanager
+    def phase(self, phase):
+        """Charges the I/O done while the block runs to one call of a phase, and times it."""
+        counts = self._counts(phase)
+        counts['calls'] += 1
+        self._running.append(counts)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            counts['seconds'] += time.perf_counter() - start
+            # Phases of generators may end out of order; phases with equal counts must not be confused
+            for position in range(len(self._running) - 1, -1, -1):
+                if self._running[position] is counts:
+                    del self._running[position]
+                    break
+
+    def record(self, kind, key, index, counted=True):
+        """Records one block read or written.
+        :param kind: 'reads' or 'writes'.
+        :param key: The disk key of the block.
+        :param index: The position of the block among the blocks of key.
+        :param counted: Whether the block was added to io_count.
+        """
+        counts = self._running[-1] if self._running else self._counts('other')
+        counts[kind] += 1
+        counts['sequential' if self._last == (key, index - 1) else 'random'] += 1
+        if not counted:
+            counts['uncounted_writes'] += 1
+        self._last = (key, index)
+        per_key = self.keys.get(key)
+        if per_key is None:
+            per_key = self.keys[key] = {'reads': 0, 'writes': 0}
+        per_key[kind] += 1
+
+    def reset(self):
+        self.totals.clear()
+        self.keys.clear()
+        self._last = None
+
+    def summary(self):
+        """Returns the counts and time of every phase, and their total.
+        :return: A dict with a 'phases' dict mapping phase names to dicts of counts, where 'io' is the
+                 share of reads and writes counted in io_count, a 'total' dict of the same counts
+                 and a 'keys' dict of the blocks read and written per disk key.
+        """
+        phases = {}
+        total = dict.fromkeys(('seconds', 'io') + self.EVENTS, 0)
+        for phase, counts in self.totals.items():
+            row = dict(counts)
+            row['io'] = counts['reads'] + counts['writes'] - counts['uncounted_writes']
+            phases[phase] = row
+            for name in total:
+                total[name] += row[name]
+        return {'phases': phases, 'total': total, 'keys': {key: dict(counts) for key, counts in self.keys.items()}}
+
+    def bucket_histograms(self):
+        """Returns the blocks read and written per bucket, for every relation that was partitioned.
+        :return: A dict mapping relation keys to dicts of 'reads' and 'writes' lists, indexed by bucket.
+        """
+        histograms = {}
+        for key, counts in self.keys.items():
+            relation, separator, bucket = str(key).rpartition('_bucket_')
+            if not separator or not bucket.isdigit():
+                continue
+            histogram = histograms.setdefault(relation, {'reads': [], 'writes': []})
+            for kind in ('reads', 'writes'):
+                values = histogram[kind]
+                values.extend([0] * (int(bucket) + 1 - len(values)))
+                values[int(bucket)] = counts[kind]
+        for histogram in histograms.values():
+            size = max(map(len, histogram.values()))
+            for values in histogram.values():
+                values.extend([0] * (size - len(values)))
+        return histograms
+
+    def compare(self, expected):
+        """Compares the traced I/O with a cost model, such as two_pass_expected_io.
+        :param expected: A dict mapping phase names to their expected I/O.
+        :return: A dict mapping every phase, and 'total', to its 'expected' and 'actual' I/O and their 'difference'.
+        """
+        phases = self.summary()['phases']
+        report = {}
+        for phase in list(expected) + [phase for phase in phases if phase not in expected]:
+            actual = phases[phase]['io'] if phase in phases else 0
+            report[phase] = {'expected': expected.get(phase), 'actual': actual,
+                             'difference': None if phase not in expected else actual - expected[phase]}
+        total_expected = sum(expected.values())
+        total_actual = sum(row['actual'] for row in report.values())
+        report['total'] = {'expected': total_expected, 'actual': total_actual,
+                           'difference': total_actual - total_expected}
+        return report
+
+
 class StorageManager:
-    def __init__(self, num_blocks, tuples_per_block):
+    def __init__(self, num_blocks, tuples_per_block, replacement=None):
+        """
+        :param num_blocks: The number of blocks M that fit in memory.
+        :param tuples_per_block: The number of tuples written to each block.
+        :param replacement: A replacement policy for a BufferPoolManager of num_blocks frames: 'lru', 'mru',
+                            'clock' or a policy object. Reads, output buffers and the blocks the joins hold in
+                            memory then share those frames, and blocks still cached are read without I/O.
+                            Without one, blocks are read from disk every time.
+        """
         self.num_blocks = num_blocks
         self.tuples_per_block = tuples_per_block
         self.memory = [None] * num_blocks  # Last buffer is reserved for incoming data
         self.disk = {}
         self.io_count = 0
+        self.pool = None if replacement is None else \
+            BufferPoolManager(num_blocks, self._read_block, self._write_block, replacement)
+        self._reservations = 0
+        self.tracer = None
 
     def write_to_disk(self, key, data):
         if key not in self.disk:
             self.disk[key] = []
+        start = len(self.disk[key])
         self.disk[key].extend([data[i:i + self.tuples_per_block] for i in range(0, len(data), self.tuples_per_block)])
         self.io_count += len(data) // self.tuples_per_block
+        if self.tracer is not None:
+            counted = start + len(data) // self.tuples_per_block
+            for index in range(start, len(self.disk[key])):
+                self.tracer.record('writes', key, index, index < counted)
 
     def read_from_disk(self, key):
         if key in self.disk:
-            for block in self.disk[key]:
-                yield block
-                self.io_count += 1
+            if self.pool is None:
+                for index, block in enumerate(self.disk[key]):
+                    yield block
+                    self.io_count += 1
+                    if self.tracer is not None:
+                        self.tracer.record('reads', key, index)
+                return
+            for index in range(len(self.disk[key])):
+                page_id = (key, index)
+                block = self.pool.pin(page_id)
+                try:
+                    yield block
+                finally:
+                    self.pool.unpin(page_id)
+
+    def remove_from_disk(self, key):
+        """Deletes the blocks of key, along with any copies the buffer pool still caches."""
+        self.disk.pop(key, None)
+        if self.pool is not None:
+            self.pool.discard(key)
+
+    def new_buffer(self, key):
+        """Returns an empty output block for key, to be filled and passed to write_buffer.
+        With a buffer pool the block is a pinned frame, so output buffers count against the M blocks.
+        """
+        block = []
+        if self.pool is not None:
+            self.pool.new_page((key, len(self.disk.get(key, ()))), block)
+        return block
+
+    def write_buffer(self, key, block):
+        """Appends an output block from new_buffer to the blocks of key.
+        With a buffer pool the block is written and its frame released, but it stays cached until evicted.
+        """
+        if self.pool is None:
+            self.write_to_disk(key, block)
+            return
+        page_id = (key, len(self.disk.get(key, ())))
+        self.pool.flush(page_id)
+        self.pool.unpin(page_id)
+
+    @contextmanager
+    def reserve(self, num_blocks):
+        """Holds num_blocks frames of the buffer pool for data kept in memory outside of it, such as
+        a hash table built from blocks already read, so that other reads cannot use them.
+        Does nothing without a buffer pool.
+        """
+        pages = []
+        try:
+            if self.pool is not None:
+                for _ in range(num_blocks):
+                    self._reservations += 1
+                    pages.append((None, self._reservations))
+                    self.pool.new_page(pages[-1], [], dirty=False)
+            yield
+        finally:
+            for page_id in pages:
+                self.pool.drop(page_id)
+
+    def pool_stats(self):
+        """Returns the buffer pool counters, or None without a buffer pool."""
+        return None if self.pool is None else self.pool.stats()
+
+    def enable_tracing(self):
+        """Starts recording every block read and written, by phase, see IOTracer.
+        The joins mark their phases through `phase`.
+        :return: The IOTracer that collects the trace, also kept as `tracer`.
+        """
+        if self.tracer is None:
+            self.tracer = IOTracer()
+        return self.tracer
+
+    def disable_tracing(self):
+        """Stops recording block reads and writes."""
+        self.tracer = None
+
+    def phase(self, name):
+        """Returns a context manager charging the I/O done inside it to a phase of the trace.
+        It does nothing while tracing is off.
+        """
+        return nullcontext() if self.tracer is None else self.tracer.phase(name)
 
     def clear_memory(self):
         self.memory = [None] * self.num_blocks
+        if self.pool is not None:
+            # Dirty pages are written back; clean ones stay cached for later reads
+            self.pool.flush()
+
+    def _read_block(self, page_id):
+        key, index = page_id
+        self.io_count += 1
+        if self.tracer is not None:
+            self.tracer.record('reads', key, index)
+        return self.disk[key][index]
 
-    def hash_and_partition(self, relation_key, hash_function, hash_index=0):
-        """Reference: Figure 15.12 page 733 in Database Managment The complete System 2nd Edition"""
+    def _write_block(self, page_id, block):
+        key, index = page_id
+        blocks = self.disk.setdefault(key, [])
+        if index != len(blocks):
+            raise ValueError(f"block {index} of {key} is written out of order, {len(blocks)} blocks are on disk")
+        blocks.append(block)
+        self.io_count += 1
+        if self.tracer is not None:
+            self.tracer.record('writes', key, index)
+
+    def hash_and_partition(self, relation_key, hash_function, hash_index=0, build_filter=None, probe_filter=None):
+        """Reference: Figure 15.12 page 733 in Database Managment The complete System 2nd Edition
+        :param build_filter: A BloomFilter that every join key of the relation is added to.
+        :param probe_filter: A BloomFilter of the other relation's join keys. Tuples whose key it
+                             rules out are dropped before they reach a bucket.
+        """
+        blocks = self._blocks_to_partition(relation_key, hash_index, build_filter, probe_filter)
+        if self.pool is not None:
+            self._pooled_hash_and_partition(relation_key, hash_function, hash_index, blocks)
+            return
         buffers = {i: [] for i in range(self.num_blocks - 1)}  # Initialize M-1 buffers
-        for block in self.read_from_disk(relation_key):
+        for block in blocks:
             self.memory[-1] = block  # Load block into the last memory buffer
             for record in block:
                 key = record[hash_index]
@@ -47,6 +466,83 @@ class StorageManager:
             if buffer:
                 self.write_to_disk(f"{relation_key}_bucket_{index}", buffer)
 
+    def _blocks_to_partition(self, relation_key, hash_index, build_filter, probe_filter):
+        """Reads a relation for hash_and_partition, filtering and recording join keys a block at a time."""
+        if build_filter is None and probe_filter is None:
+            yield from self.read_from_disk(relation_key)
+            return
+        for block in self.read_from_disk(relation_key):
+            if probe_filter is not None:
+                block = [record for record in block if record[hash_index] in probe_filter]
+            if build_filter is not None:
+                build_filter.update(map(itemgetter(hash_index), block))
+            yield block
+
+    def _pooled_hash_and_partition(self, relation_key, hash_function, hash_index, blocks):
+        """hash_and_partition with the M-1 bucket buffers held as pinned frames of the buffer pool."""
+        buffers = {}
+        for block in blocks:
+            self.memory[-1] = block
+            for record in block:
+                bucket_index = hash_function(record[hash_index], self.num_blocks - 1)
+                name = f"{relation_key}_bucket_{bucket_index}"
+                buffer = buffers.get(bucket_index)
+                if buffer is None:
+                    buffer = buffers[bucket_index] = self.new_buffer(name)
+                buffer.append(record)
+                if len(buffer) >= self.tuples_per_block:
+                    self.write_buffer(name, buffer)
+                    del buffers[bucket_index]
+
+        for index, buffer in buffers.items():
+            self.write_buffer(f"{relation_key}_bucket_{index}", buffer)
+
+    def hash_and_partition_columnar(self, relation_key, hash_index=0, batch_blocks=1024):
+        """hash_and_partition with hash_function, vectorized with NumPy over batches of blocks.
+        The join keys of a batch go into an int64 array and their buckets are computed in one
+        operation. Records are then grouped by bucket with a stable argsort and bincount, so every
+        bucket keeps the input order. Each bucket gets its whole blocks written, and the remainder
+        is carried over to the next batch; partial blocks are written at the end. Without a buffer
+        pool, buckets and io_count come out identical to hash_and_partition.
+        :param relation_key: The relation to partition; its join keys must be integers.
+        :param hash_index: The position of the join attribute.
+        :param batch_blocks: The number of blocks hashed per vector operation. The batch is a staging
+                             area outside the M blocks of memory.
+        """
+        if np is None:
+            raise ImportError("hash_and_partition_columnar requires NumPy")
+        num_buckets = self.num_blocks - 1
+        carried = [[] for _ in range(num_buckets)]
+        blocks = self.read_from_disk(relation_key)
+        while True:
+            batch = list(islice(blocks, batch_blocks))
+            if not batch:
+                break
+            self.memory[-1] = batch[-1]
+            count = sum(map(len, batch))
+            keys = np.fromiter(map(itemgetter(hash_index), chain.from_iterable(batch)), dtype=np.int64, count=count)
+            bucket_ids = keys % num_buckets
+            if num_buckets <= 1 << 16:
+                bucket_ids = bucket_ids.astype(np.uint16)  # A stable sort of 16-bit ints is a radix sort
+            order = np.argsort(bucket_ids, kind='stable')
+            records = np.fromiter(chain.from_iterable(batch), dtype=object, count=count)[order].tolist()
+            start = 0
+            for bucket, end in enumerate(np.cumsum(np.bincount(bucket_ids, minlength=num_buckets)).tolist()):
+                if end > start:
+                    carry = carried[bucket]
+                    size = len(carry) + end - start
+                    full = start + size - size % self.tuples_per_block - len(carry)  # End of the whole blocks
+                    if full > start:
+                        self.write_to_disk(f"{relation_key}_bucket_{bucket}", carry + records[start:full])
+                        carried[bucket] = records[full:end]
+                    else:
+                        carry.extend(records[start:end])
+                start = end
+
+        for bucket, pending in enumerate(carried):
+            if pending:
+                self.write_to_disk(f"{relation_key}_bucket_{bucket}", pending)
+
     def visualize_hashing_results(self, relation_key):
         bucket_sizes = {f"{relation_key}_bucket_{i}": sum(len(block) for block in self.disk.get(f"{relation_key}_bucket_{i}", [])) for i in range(self.num_blocks - 1)}
         plt.bar(bucket_sizes.keys(), bucket_sizes.values())
@@ -66,32 +562,505 @@ def hash_function(key, num_buckets):
     return key % num_buckets
 
 
+class BloomFilter:
+    """A Bloom filter of join keys, sized for an expected number of keys and a false-positive rate.
+    A key that was added is always reported present; any other key is reported present with about
+    false_positive_rate probability. Positions come from double hashing of the key's hash.
+    :param capacity: The expected number of keys.
+    :param false_positive_rate: The target share of absent keys that are reported present.
+    """
+    def __init__(self, capacity, false_positive_rate=0.01):
+        capacity = max(1, capacity)
+        self.num_bits = max(8, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key):
+        mixed = hash(key) * 0x9E3779B97F4A7C15 & 0xFFFFFFFFFFFFFFFF
+        first, step = mixed >> 32, mixed & 0xFFFFFFFF | 1
+        return [(first + i * step) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def update(self, keys):
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & 1 << (position & 7) for position in self._positions(key))
+
+
 def two_pass_join(storage, join_relation={'relation_r': 1, 'relation_s':0}):
     """Implements the two-pass join using hashing with explicit block processing."""
-    
-    
-    # First pass: Partitioning phase by reading each block, hashing, and storing hashed blocks
-    for relation, hash_index in join_relation.items():
-        storage.hash_and_partition(relation, 
-                                   hash_function, 
-                                   hash_index)
+    return list(iter_two_pass_join(storage, join_relation, visualize=True))
 
-        # Visualize partitioning phase
-        storage.visualize_hashing_results(relation)
+
+def iter_two_pass_join(storage, join_relation={'relation_r': 1, 'relation_s': 0}, batches=False, visualize=False,
+                       columnar=False, bloom_filter=False, false_positive_rate=0.01):
+    """The two-pass join of two_pass_join as a generator. Output is produced while the bucket pairs are
+    joined, so only one bucket pair's hash table is held at a time, however large the result is.
+    Each pair is joined within the M blocks of storage, see _join_bucket_pair.
+    :param storage: The StorageManager holding both relations.
+    :param join_relation: The two relation keys, R first, mapped to the position of the join attribute.
+    :param batches: Yield one list of tuples per bucket pair instead of single tuples.
+    :param visualize: Plot the bucket sizes after partitioning, as two_pass_join does.
+    :param columnar: Partition with the NumPy path, StorageManager.hash_and_partition_columnar.
+    :param bloom_filter: Build a Bloom filter of the join keys while the first relation of join_relation
+                         is partitioned, and drop tuples of the second one that it rules out before
+                         they are written to a bucket. It is sized for B(first) * tuples_per_block keys.
+    :param false_positive_rate: The target false-positive rate of the Bloom filter.
+    :return: A generator of (a, b, c) tuples, or of lists of them.
+    """
+    if columnar and bloom_filter:
+        raise ValueError("the columnar partitioning path does not support a Bloom filter")
+    keys = None
+    if bloom_filter:
+        first = next(iter(join_relation))
+        keys = BloomFilter(len(storage.disk.get(first, [])) * storage.tuples_per_block, false_positive_rate)
+    # First pass: Partitioning phase by reading each block, hashing, and storing hashed blocks
+    for position, (relation, hash_index) in enumerate(join_relation.items()):
+        with storage.phase(f"partition {relation}"):
+            if columnar:
+                storage.hash_and_partition_columnar(relation, hash_index)
+            elif keys is None:
+                storage.hash_and_partition(relation,
+                                           hash_function,
+                                           hash_index)
+            elif position == 0:
+                storage.hash_and_partition(relation, hash_function, hash_index, build_filter=keys)
+            else:
+                storage.hash_and_partition(relation, hash_function, hash_index, probe_filter=keys)
+        if visualize:
+            storage.visualize_hashing_results(relation)
     # Second pass: Join phase by reading hashed blocks and performing join
+    with storage.phase('join'):
+        for i in range(storage.num_blocks - 1):
+            joined = _join_bucket_pair(storage, f'relation_r_bucket_{i}', f'relation_s_bucket_{i}')
+            if batches:
+                batch = list(joined)
+                if batch:
+                    yield batch
+            else:
+                yield from joined
+
+
+def _join_bucket_pair(storage, name_r, name_s):
+    """Joins the R and S buckets of one partition within the M blocks of storage.
+    The bucket with fewer blocks is held in memory, under storage.reserve, and the other one is
+    read through it a block at a time. If neither fits in the M - 2 blocks left beside an input
+    and an output buffer, the pair is joined with _iter_block_join instead.
+    """
+    blocks_r, blocks_s = len(storage.disk.get(name_r, ())), len(storage.disk.get(name_s, ()))
+    if not blocks_r or not blocks_s:
+        return
+    build_r = blocks_r <= blocks_s
+    if min(blocks_r, blocks_s) > max(1, storage.num_blocks - 2):
+        yield from _iter_block_join(storage, (name_r, 1, True), (name_s, 0, False))
+        return
+    build, probe = (name_r, name_s) if build_r else (name_s, name_r)
+    with storage.reserve(min(blocks_r, blocks_s)):
+        bucket = list(storage.read_from_disk(build))
+        blocks = storage.read_from_disk(probe)
+        try:
+            if build_r:
+                yield from iter_join_buckets(bucket, blocks, build_r=True)
+            else:
+                yield from iter_join_buckets(blocks, bucket, build_r=False)
+        finally:
+            blocks.close()
+
+
+def two_pass_expected_io(storage, join_relation={'relation_r': 1, 'relation_s': 0}):
+    """Returns the I/O of every phase of iter_two_pass_join in the textbook cost model, 3(B(R) + B(S))
+    in total: each relation is read and written once as buckets, and every bucket is read once.
+    It is computed from the blocks of the relations, so call it before they are removed.
+    :return: A dict mapping the phase names of iter_two_pass_join to their expected I/O, for IOTracer.compare.
+    """
+    blocks = {relation: len(storage.disk.get(relation, [])) for relation in join_relation}
+    expected = {f"partition {relation}": 2 * count for relation, count in blocks.items()}
+    expected['join'] = sum(blocks.values())
+    return expected
+
+
+def hash_join_buckets(bucket_r, bucket_s, build_r=None):
+    """Joins one pair of buckets of R(A, B) and S(B, C) on B, see iter_join_buckets.
+    :return: A list of (a, b, c) tuples.
+    """
+    return list(iter_join_buckets(bucket_r, bucket_s, build_r))
+
+
+def iter_join_buckets(bucket_r, bucket_s, build_r=None):
+    """Joins one pair of buckets of R(A, B) and S(B, C) on B.
+    A hash table is built on the bucket holding fewer tuples and the other bucket is streamed
+    through it as probes, so the cost is linear in the bucket sizes.
+    :param bucket_r: The blocks of the R bucket, each a list of (a, b) tuples.
+    :param bucket_s: The blocks of the S bucket, each a list of (b, c) tuples.
+    :param build_r: Build the hash table on R if True, on S if False. The probe bucket may then
+                    be any iterable of blocks, such as a read_from_disk generator.
+    :return: A generator of (a, b, c) tuples.
+    """
+    table = {}
+    if build_r is None:
+        build_r = sum(map(len, bucket_r)) <= sum(map(len, bucket_s))
+    if build_r:
+        for block in bucket_r:
+            for a, b in block:
+                table.setdefault(b, []).append(a)
+        for block in bucket_s:
+            for b, c in block:
+                for a in table.get(b, ()):
+                    yield a, b, c
+    else:
+        for block in bucket_s:
+            for b, c in block:
+                table.setdefault(b, []).append(c)
+        for block in bucket_r:
+            for a, b in block:
+                for c in table.get(b, ()):
+                    yield a, b, c
+
+
+def parallel_two_pass_join(storage, join_relation={'relation_r': 1, 'relation_s': 0}, num_workers=None):
+    """Runs two_pass_join on a pool of worker processes.
+    Each relation is split into one contiguous range of blocks per worker, and the ranges of R and S
+    are partitioned at the same time. The spills of the workers are merged per bucket in block order,
+    so the buckets hold the same blocks as with two_pass_join and io_count grows by the same amount.
+    The bucket pairs are then joined by the workers, and their output is gathered in bucket order.
+    :param storage: The StorageManager holding both relations.
+    :param join_relation: The two relation keys, R first, mapped to the position of the join attribute.
+    :param num_workers: The number of worker processes, os.cpu_count() by default. With 1, all work
+                        runs in this process.
+    :return: The joined (a, b, c) tuples, in the order two_pass_join returns them as long as every
+             bucket pair has a bucket that fits in M - 2 blocks; the workers hold whole buckets.
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    num_buckets = storage.num_blocks - 1
+    executor = ProcessPoolExecutor(num_workers) if num_workers > 1 else None
+    submit = executor.submit if executor is not None else _run_inline
+    try:
+        # First pass: every worker partitions one block range of R or S
+        spills = {}
+        for relation, hash_index in join_relation.items():
+            with storage.phase(f"partition {relation}"):
+                blocks = list(storage.read_from_disk(relation))
+            step = max(1, -(-len(blocks) // num_workers))
+            spills[relation] = [submit(_partition_blocks, blocks[i:i + step], hash_index, num_buckets)
+                                for i in range(0, len(blocks), step)]
+        for relation, futures in spills.items():
+            buckets = [future.result() for future in futures]
+            with storage.phase(f"partition {relation}"):
+                for i in range(num_buckets):
+                    records = [record for bucket in buckets for record in bucket[i]]
+                    if records:
+                        storage.write_to_disk(f"{relation}_bucket_{i}", records)
+
+        # Second pass: the bucket pairs are joined in parallel
+        with storage.phase('join'):
+            buckets_r = [list(storage.read_from_disk(f'relation_r_bucket_{i}')) for i in range(num_buckets)]
+            buckets_s = [list(storage.read_from_disk(f'relation_s_bucket_{i}')) for i in range(num_buckets)]
+            # The build side is the bucket with fewer blocks, as in iter_two_pass_join
+            build_r = [len(bucket_r) <= len(bucket_s) for bucket_r, bucket_s in zip(buckets_r, buckets_s)]
+            if executor is not None:
+                joined = executor.map(hash_join_buckets, buckets_r, buckets_s, build_r)
+            else:
+                joined = map(hash_join_buckets, buckets_r, buckets_s, build_r)
+            result = []
+            for part in joined:
+                result.extend(part)
+        return result
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def _partition_blocks(blocks, hash_index, num_buckets):
+    """Hashes the records of a block range into num_buckets lists, keeping their order."""
+    buckets = [[] for _ in range(num_buckets)]
+    for block in blocks:
+        for record in block:
+            buckets[hash_function(record[hash_index], num_buckets)].append(record)
+    return buckets
+
+
+def _run_inline(function, *args):
+    """Calls function right away and wraps its result in a finished Future."""
+    future = Future()
+    future.set_result(function(*args))
+    return future
+
+
+
+
+FUDGE_FACTOR = 1.2  # Headroom of the hybrid hash join for uneven partition sizes
+
+
+def salted_hash(key, salt, num_buckets):
+    """Hashes a key into num_buckets buckets; every salt gives an unrelated bucket assignment."""
+    return hash((salt, key)) % num_buckets
+
+
+def hybrid_hash_join(storage, join_relation={'relation_r': 1, 'relation_s': 0}, max_depth=4, heavy_fraction=0.1):
+    """Joins R(A, B) and S(B, C) on B with a hybrid hash join that stays within storage.num_blocks blocks.
+    The relation with fewer blocks is the build side. While it is partitioned, the tuples of
+    partition 0 stay resident in storage.memory and only the other partitions are written out;
+    probe tuples of partition 0 are joined at once instead of being written and read back.
+    Partitions that still do not fit in memory are repartitioned recursively with a salted hash.
+    Keys holding more than heavy_fraction of a partition, and enough tuples to fill half the join
+    memory, are found with a Misra-Gries summary while it is written. At the next level they get
+    partitions of their own, since no hash can split them.
+    :param storage: The StorageManager holding both relations.
+    :param join_relation: The two relation keys, R first, mapped to the position of the join attribute.
+    :param max_depth: Partitions still too large after this many levels are joined block by block.
+    :param heavy_fraction: The share of a partition's tuples that makes a key a heavy hitter.
+    :return: A tuple (result, report). The report holds the I/O count of the join, the 3(B_R + B_S)
+             count of the plain two-pass join, the I/O saved and counters of what the join did.
+    """
+    (relation_r, r_index), (relation_s, s_index) = join_relation.items()
+    io_start = storage.io_count
+    report = {'io': 0, 'two_pass_io': 3 * (len(storage.disk.get(relation_r, [])) + len(storage.disk.get(relation_s, []))),
+              'saved_io': 0, 'resident_tuples': 0, 'spilled_partitions': 0, 'depth': 0,
+              'heavy_keys': 0, 'block_joins': 0}
     result = []
-    for i in range(storage.num_blocks - 1):
-        bucket_r = storage.disk.get(f'relation_r_bucket_{i}', [])
-        bucket_s = storage.disk.get(f'relation_s_bucket_{i}', [])
-        for lr in bucket_r:
-            for ls in bucket_s: 
-                for a, b1 in lr:
-                    for b2, c in ls:
-                        if b1 == b2:
-                            result.append((a, b1, c))
+    _hybrid_join_level(storage, (relation_r, r_index, True), (relation_s, s_index, False),
+                       0, set(), max_depth, heavy_fraction, result, report)
+    storage.clear_memory()
+    report['io'] = storage.io_count - io_start
+    report['saved_io'] = report['two_pass_io'] - report['io']
+    return result, report
+
+
+def _joined(build_record, probe_record, build, probe):
+    """Returns the joined (a, b, c) tuple, whichever side the R tuple came from."""
+    (r_record, r_index), (s_record, s_index) = ((build_record, build[1]), (probe_record, probe[1])) if build[2] \
+        else ((probe_record, probe[1]), (build_record, build[1]))
+    return r_record[1 - r_index], r_record[r_index], s_record[1 - s_index]
+
+
+def _emit(build_record, probe_record, build, probe, result):
+    """Appends the joined (a, b, c) tuple, whichever side the R tuple came from."""
+    result.append(_joined(build_record, probe_record, build, probe))
+
+
+def _hybrid_join_level(storage, side_a, side_b, depth, heavy_keys, max_depth, heavy_fraction, result, report):
+    """Joins two inputs, each given as (disk key, join attribute position, is R), at one recursion level."""
+    report['depth'] = max(report['depth'], depth)
+    budget = storage.num_blocks - 2  # One input and one output buffer stay free
+    if len(storage.disk.get(side_a[0], [])) > len(storage.disk.get(side_b[0], [])):
+        side_a, side_b = side_b, side_a
+    build, probe = side_a, side_b
+    build_blocks = len(storage.disk.get(build[0], []))
+    if build_blocks <= budget or depth >= max_depth:
+        if build_blocks > budget:
+            report['block_joins'] += 1
+        _block_join(storage, build, probe, result)
+        return
 
-    return result
+    # Split the memory: one output buffer per spilled partition, the remaining blocks hold partition 0.
+    # Partitions are sized for FUDGE_FACTOR times the build blocks, so that partition 0 rarely outgrows
+    # its blocks and spilled partitions rarely need another level.
+    num_slots = math.ceil(build_blocks * FUDGE_FACTOR)
+    num_spilled = min(storage.num_blocks - 1, -(-(num_slots - storage.num_blocks + 1) // max(1, budget - 1)))
+    resident_blocks = storage.num_blocks - 1 - num_spilled
+    resident_capacity = resident_blocks * storage.tuples_per_block
 
+    def route(key):
+        """Returns the spilled partition of a key, or None for the resident partition 0."""
+        if key in heavy_keys:
+            return f"heavy_{key}"
+        slot = salted_hash(key, depth, num_slots)
+        return None if slot < resident_blocks else slot % num_spilled
+
+    # Build side: partition 0 is kept in memory as a hash table unless it outgrows its blocks
+    table = {}
+    resident = []
+    summaries = [{} for _ in range(num_spilled)]
+    summary_size = max(1, int(2 / heavy_fraction))
+    # A key only needs a partition of its own once its tuples would take half the join memory
+    heavy_minimum = budget * storage.tuples_per_block // 2
+
+    def keep(record, key):
+        if len(resident) < resident_capacity:
+            resident.append(record)
+            table.setdefault(key, []).append(record)
+            return True
+        return False
+
+    with storage.reserve(resident_blocks), storage.phase('partition build side'):
+        build_names, build_sizes, resident_kept = _partition_input(
+            storage, build, depth, route, keep, summaries, summary_size)
+    for i in range(resident_blocks):
+        storage.memory[num_spilled + i] = resident[i * storage.tuples_per_block:(i + 1) * storage.tuples_per_block]
+    report['resident_tuples'] += len(resident) if resident_kept else 0
+
+    # Probe side: tuples of partition 0 are joined right away
+    def probe_resident(record, key):
+        if not resident_kept:
+            return False
+        for match in table.get(key, ()):
+            _emit(match, record, build, probe, result)
+        return True
+
+    with storage.reserve(resident_blocks), storage.phase('partition probe side'):
+        probe_names, _, _ = _partition_input(storage, probe, depth, route, probe_resident)
+    storage.clear_memory()
+    del table, resident
+
+    # Second pass over the spilled partitions, recursing into the ones that are still too large
+    for partition, build_name in build_names.items():
+        probe_name = probe_names.get(partition)
+        if probe_name is not None:
+            if isinstance(partition, int):
+                summary, size = summaries[partition], build_sizes[partition]
+                child_heavy = {key for key, count in summary.items()
+                               if count > heavy_fraction * size and count > heavy_minimum}
+                report['spilled_partitions'] += 1
+                report['heavy_keys'] += len(child_heavy)
+                if sum(summary[key] for key in child_heavy) * 2 > size:
+                    # Mostly a few heavy hitters: repartitioning would only copy them once more
+                    _block_join(storage, (build_name, build[1], build[2]), (probe_name, probe[1], probe[2]), result)
+                    report['block_joins'] += 1
+                else:
+                    _hybrid_join_level(storage, (build_name, build[1], build[2]),
+                                       (probe_name, probe[1], probe[2]), depth + 1, child_heavy, max_depth, heavy_fraction, result, report)
+            else:
+                # A heavy hitter or the spilled partition 0: no hash splits them any further
+                _block_join(storage, (build_name, build[1], build[2]), (probe_name, probe[1], probe[2]), result)
+        storage.remove_from_disk(build_name)
+    for probe_name in probe_names.values():
+        storage.remove_from_disk(probe_name)
+
+
+def _partition_input(storage, side, depth, route, keep, summaries=None, summary_size=0):
+    """Reads one input and writes every tuple to the partition that route picks for its key.
+    Tuples routed to partition 0 are offered to keep; once keep turns one down, partition 0 is
+    written out as the 'resident' partition instead, together with what keep had already accepted.
+    :return: A tuple (partition names, tuples per integer partition, whether keep held all of partition 0).
+    """
+    name, index, _ = side
+    names = {}
+    sizes = {}
+    writer = _PartitionWriter(storage)
+    kept = True
+    accepted = []
+
+    def partition_name(partition):
+        if partition not in names:
+            names[partition] = f"{name}_hybrid{depth}_{partition}"
+        return names[partition]
+
+    for block in storage.read_from_disk(name):
+        storage.memory[-1] = block
+        for record in block:
+            key = record[index]
+            partition = route(key)
+            if partition is None:
+                if kept and keep(record, key):
+                    accepted.append(record)
+                    continue
+                if kept:
+                    kept = False
+                    for earlier in accepted:
+                        writer.add(partition_name('resident'), earlier)
+                    accepted = []
+                writer.add(partition_name('resident'), record)
+                continue
+            writer.add(partition_name(partition), record)
+            if isinstance(partition, int):
+                sizes[partition] = sizes.get(partition, 0) + 1
+                if summaries is not None:
+                    _count_frequent(summaries[partition], key, summary_size)
+    writer.flush()
+    return names, sizes, kept
+
+
+class _PartitionWriter:
+    """The output buffers of a partitioning pass. Each partition fills a block before it is written,
+    unless the buffer pool has no frame left for a new buffer; the fullest one is then written early."""
+    def __init__(self, storage):
+        self.storage = storage
+        self.buffers = {}
+
+    def add(self, name, record):
+        buffer = self.buffers.get(name)
+        if buffer is None:
+            pool = self.storage.pool
+            if pool is not None and not pool.free_frames() and self.buffers:
+                fullest = max(self.buffers, key=lambda name: len(self.buffers[name]))
+                self.storage.write_buffer(fullest, self.buffers.pop(fullest))
+            buffer = self.buffers[name] = self.storage.new_buffer(name)
+        buffer.append(record)
+        if len(buffer) >= self.storage.tuples_per_block:
+            self.storage.write_buffer(name, buffer)
+            del self.buffers[name]
+
+    def flush(self):
+        for name, buffer in self.buffers.items():
+            self.storage.write_buffer(name, buffer)
+        self.buffers.clear()
+
+
+def _block_join(storage, build, probe, result):
+    """Appends the output of _iter_block_join to result."""
+    result.extend(_iter_block_join(storage, build, probe))
+
+
+def _iter_block_join(storage, build, probe):
+    """Joins two inputs, each given as (disk key, join attribute position, is R), by loading the build
+    side num_blocks - 2 blocks at a time into a hash table and scanning the probe side once per load.
+    The build input is the one with fewer blocks.
+    :return: A generator of (a, b, c) tuples, yielded as each probe block is joined.
+    """
+    with storage.phase('block join'):
+        if len(storage.disk.get(build[0], [])) > len(storage.disk.get(probe[0], [])):
+            build, probe = probe, build
+        budget = max(1, storage.num_blocks - 2)
+        blocks = storage.read_from_disk(build[0])
+        try:
+            while True:
+                table = {}
+                loaded = 0
+                for block in blocks:
+                    storage.memory[loaded] = block
+                    for record in block:
+                        table.setdefault(record[build[1]], []).append(record)
+                    loaded += 1
+                    if loaded == budget:
+                        break
+                if not loaded:
+                    break
+                with storage.reserve(loaded):
+                    probe_blocks = storage.read_from_disk(probe[0])
+                    try:
+                        for block in probe_blocks:
+                            storage.memory[-1] = block
+                            for record in block:
+                                for match in table.get(record[probe[1]], ()):
+                                    yield _joined(match, record, build, probe)
+                    finally:
+                        probe_blocks.close()
+                if loaded < budget:
+                    break
+        finally:
+            blocks.close()
+            storage.clear_memory()
+
+
+def _count_frequent(counters, key, size):
+    """Adds one occurrence of a key to a Misra-Gries summary of at most size counters.
+    Any key making up more than 1 / (size + 1) of the stream keeps a counter.
+    """
+    if key in counters:
+        counters[key] += 1
+    elif len(counters) < size:
+        counters[key] = 1
+    else:
+        for other in list(counters):
+            counters[other] -= 1
+            if not counters[other]:
+                del counters[other]
 
 
 
@@ -102,17 +1071,90 @@ def pandas_join(relation_r, relation_s):
     joined_df = pd.merge(df_r, df_s, on='B', how='inner')
     return joined_df
 
-def sanity_check(storage, two_pass_results, relation_r, relation_s):
-    """Checks the correctness of the join results and compares I/O costs."""
+class JoinDigest:
+    """An order-independent digest of join output: the tuple count and the sum of 64-bit hashes of
+    the tuples. Two outputs with the same tuples in any order, duplicates included, get equal digests.
+    :param results: Tuples to add right away.
+    """
+    def __init__(self, results=()):
+        self.count = 0
+        self.value = 0
+        for record in results:
+            self.add(record)
+
+    def add(self, record):
+        self.count += 1
+        self.value = (self.value + int.from_bytes(blake2b(repr(record).encode(), digest_size=8).digest(), 'little')) \
+            & 0xFFFFFFFFFFFFFFFF
+
+    def __eq__(self, other):
+        return isinstance(other, JoinDigest) and (self.count, self.value) == (other.count, other.value)
+
+    def __repr__(self):
+        return f"JoinDigest(count={self.count}, value={self.value:016x})"
+
+
+class JoinResultSink:
+    """Writes join output tuples to an open text file, one per line, in chunks of chunk_size lines.
+    Every tuple written is added to `digest`, so the output can be checked without being kept.
+    :param file: The text file to write to.
+    :param chunk_size: The number of lines buffered before each write.
+    """
+    def __init__(self, file, chunk_size=10000):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.lines = []
+        self.digest = JoinDigest()
+
+    def write(self, record):
+        self.lines.append(f"{record}\n")
+        self.digest.add(record)
+        if len(self.lines) >= self.chunk_size:
+            self.flush()
+
+    def write_all(self, results):
+        """Writes every tuple of an iterable, or every tuple of every batch if it yields lists."""
+        for record in results:
+            if isinstance(record, list):
+                for item in record:
+                    self.write(item)
+            else:
+                self.write(record)
+        return self
+
+    def flush(self):
+        self.file.write(''.join(self.lines))
+        self.lines = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
 
-    # Convert two-pass join results to DataFrame for easier comparison
-    two_pass_df = pd.DataFrame(two_pass_results, columns=['A', 'B', 'C'])
+def iter_expected_join(relation_r, relation_s):
+    """Yields the natural join of R(A, B) and S(B, C) computed in memory, for checking other joins."""
+    index = {}
+    for b, c in relation_s:
+        index.setdefault(b, []).append(c)
+    for a, b in relation_r:
+        for c in index.get(b, ()):
+            yield a, b, c
 
-    # Get pandas join results for correctness verification
-    pandas_results = pandas_join(relation_r, relation_s)
 
-    # Compare the results for correctness
-    correct_results = two_pass_df.equals(pandas_results.sort_values(['A', 'B', 'C']).reset_index(drop=True))
+def sanity_check(storage, two_pass_results, relation_r, relation_s, io_start=0):
+    """Checks the correctness of the join results and compares I/O costs.
+    two_pass_results may be any iterable of tuples, consumed once, or the JoinDigest of a JoinResultSink.
+    Both sides are compared as digests, so neither join result is held in memory.
+    The I/O of the join is io_count less io_start, which should be io_count just before the join:
+    it is what the two-pass join costs in the 3(B_R + B_S) model, as the buckets read by its join
+    phase are counted. With the default of 0, the writes of R and S are included too.
+    If storage is tracing, the traced I/O of every phase is printed next to two_pass_expected_io.
+    """
+    if not isinstance(two_pass_results, JoinDigest):
+        two_pass_results = JoinDigest(two_pass_results)
+    correct_results = two_pass_results == JoinDigest(iter_expected_join(relation_r, relation_s))
     # Calculate theoretical I/O costs
     tuples_per_block = storage.tuples_per_block
     B_R = len(relation_r) // tuples_per_block + (1 if len(relation_r) % tuples_per_block != 0 else 0)
@@ -120,8 +1162,15 @@ def sanity_check(storage, two_pass_results, relation_r, relation_s):
     theoretical_io = 3 * (B_R + B_S)
 
     # Compare theoretical and actual I/O costs
-    actual_io = storage.io_count
+    actual_io = storage.io_count - io_start
     print(f"Expected I/O Operations: {theoretical_io}")
     print(f"Actual I/O Operations: {actual_io}")
+    if storage.tracer is not None:
+        phases = storage.tracer.summary()['phases']
+        for phase, row in storage.tracer.compare(two_pass_expected_io(storage)).items():
+            counts = phases.get(phase)
+            detail = '' if counts is None else \
+                f" ({counts['sequential']} sequential, {counts['random']} random, {counts['seconds']:.3f}s)"
+            print(f"  {phase}: expected {row['expected']}, actual {row['actual']}{detail}")
 
     return correct_results
@@ -0,0 +1,195 @@
+import math
+from collections import Counter
+from heapq import merge
+from itertools import chain, groupby, islice
+from operator import itemgetter
+from Join_based_on_hashing import iter_two_pass_join
+
+
+def sort_merge_join(storage, join_relation={'relation_r': 1, 'relation_s': 0}):
+    """Joins R(A, B) and S(B, C) on B with a two-pass sort-merge join, see iter_sort_merge_join.
+    :return: A list of (a, b, c) tuples sorted on B.
+    """
+    return list(iter_sort_merge_join(storage, join_relation))
+
+
+def iter_sort_merge_join(storage, join_relation={'relation_r': 1, 'relation_s': 0}):
+    """Joins R(A, B) and S(B, C) on B with a two-pass sort-merge join on a StorageManager.
+    The first pass reads num_blocks blocks at a time, sorts them on the join attribute and writes
+    them back as a sorted run. The second pass merges the runs of both relations at once, one
+    buffer per run, and joins the two merged streams while they are produced. If there are more
+    runs than buffers, groups of num_blocks - 1 runs of the relation with the most runs are first
+    merged into one, which costs one more read and write of the runs merged. With 2 blocks, runs are
+    merged two at a time, which needs one output buffer beyond num_blocks. The tuples of one key are
+    grouped in memory before they are joined. The runs are deleted once the join is done.
+    :param storage: The StorageManager holding both relations.
+    :param join_relation: The two relation keys, R first, mapped to the position of the join attribute.
+    :return: A generator of (a, b, c) tuples sorted on B.
+    """
+    if storage.num_blocks < 2:
+        raise ValueError(f"a sort-merge join needs at least 2 blocks of memory, not {storage.num_blocks}")
+    (relation_r, r_index), (relation_s, s_index) = join_relation.items()
+    with storage.phase(f"sort {relation_r}"):
+        runs_r = _sorted_runs(storage, relation_r, r_index)
+    with storage.phase(f"sort {relation_s}"):
+        runs_s = _sorted_runs(storage, relation_s, s_index)
+    level = 1
+    while len(runs_r) + len(runs_s) > storage.num_blocks:
+        with storage.phase('merge runs'):
+            if len(runs_r) >= len(runs_s):
+                runs_r = _merge_runs(storage, relation_r, r_index, runs_r, level)
+            else:
+                runs_s = _merge_runs(storage, relation_s, s_index, runs_s, level)
+        level += 1
+
+    with storage.phase('join'):
+        scans_r = [_scan(storage, run) for run in runs_r]
+        scans_s = [_scan(storage, run) for run in runs_s]
+        try:
+            stream_r = merge(*scans_r, key=itemgetter(r_index))
+            stream_s = merge(*scans_s, key=itemgetter(s_index))
+            groups_r = groupby(stream_r, key=itemgetter(r_index))
+            groups_s = groupby(stream_s, key=itemgetter(s_index))
+            group_r = next(groups_r, None)
+            group_s = next(groups_s, None)
+            while group_r is not None and group_s is not None:
+                if group_r[0] < group_s[0]:
+                    group_r = next(groups_r, None)
+                elif group_r[0] > group_s[0]:
+                    group_s = next(groups_s, None)
+                else:
+                    matches = list(group_s[1])
+                    for r_record in group_r[1]:
+                        for s_record in matches:
+                            yield r_record[1 - r_index], r_record[r_index], s_record[1 - s_index]
+                    group_r = next(groups_r, None)
+                    group_s = next(groups_s, None)
+        finally:
+            # Release the blocks the scans still hold before their runs are deleted
+            for scan in scans_r + scans_s:
+                scan.close()
+            for run in runs_r + runs_s:
+                storage.remove_from_disk(run)
+
+
+def _sorted_runs(storage, relation, index):
+    """Writes a relation as sorted runs of num_blocks blocks and returns the run names."""
+    runs = []
+    blocks = storage.read_from_disk(relation)
+    while True:
+        chunk = list(islice(blocks, storage.num_blocks))
+        if not chunk:
+            break
+        storage.memory[:len(chunk)] = chunk
+        name = f"{relation}_run0_{len(runs)}"
+        storage.write_to_disk(name, sorted(chain.from_iterable(chunk), key=itemgetter(index)))
+        runs.append(name)
+    storage.clear_memory()
+    return runs
+
+
+def _merge_runs(storage, relation, index, runs, level):
+    """Merges the first num_blocks - 1 runs, at least 2, into one, with one output buffer, and returns
+    the new run list."""
+    fan_in = max(2, storage.num_blocks - 1)
+    group, rest = runs[:fan_in], runs[fan_in:]
+    name = f"{relation}_run{level}_0"
+    buffer = []
+    for record in merge(*(_scan(storage, run) for run in group), key=itemgetter(index)):
+        buffer.append(record)
+        if len(buffer) == storage.tuples_per_block:
+            storage.write_to_disk(name, buffer)
+            buffer = []
+    if buffer:
+        storage.write_to_disk(name, buffer)
+    for run in group:
+        storage.remove_from_disk(run)
+    return rest + [name]
+
+
+def _scan(storage, run):
+    """Yields the tuples of a run. Closing the generator releases the block it is reading."""
+    blocks = storage.read_from_disk(run)
+    try:
+        for block in blocks:
+            yield from block
+    finally:
+        blocks.close()
+
+
+def estimate_skew(storage, relation, index, sample_blocks=32):
+    """Estimates the share of a relation's tuples that hold its most frequent join key, from up to
+    sample_blocks evenly spaced blocks. Like B(R), it is read as a catalog statistic and does not
+    count toward io_count.
+    :return: A fraction between 0 and 1, 0 for an empty relation.
+    """
+    blocks = storage.disk.get(relation, [])
+    step = max(1, len(blocks) // sample_blocks)
+    counts = Counter()
+    for i in range(0, min(len(blocks), step * sample_blocks), step):
+        counts.update(map(itemgetter(index), blocks[i]))
+    total = sum(counts.values())
+    return max(counts.values()) / total if total else 0.0
+
+
+def estimate_join_costs(storage, join_relation={'relation_r': 1, 'relation_s': 0}, skew=None):
+    """Estimates the I/O of the hash join and of the sort-merge join from B(R), B(S), M and the skew.
+    Both cost 3(B(R) + B(S)) when everything fits in two passes. Beyond that:
+    - hash: every extra partitioning level costs 2(B(R) + B(S)). The most frequent key of the
+      smaller relation always stays in one partition; if its blocks exceed M - 2, the matching
+      partition of the other relation is read once more for every further M - 2 of them.
+    - sort-merge: every extra merge pass costs 2(B(R) + B(S)). Only a key that is frequent in both
+      relations hurts: its group on the smaller side is joined M - 2 blocks at a time with the
+      group on the other side.
+    The sort-merge join needs 3 blocks to merge two runs into an output buffer, so below that its
+    estimate is math.inf.
+    :param skew: A dict of the share of the most frequent key per relation key, estimated with
+                 estimate_skew by default.
+    :return: A dict with the estimated 'hash' and 'sort_merge' I/O, and the skew used.
+    """
+    (relation_r, r_index), (relation_s, s_index) = join_relation.items()
+    if skew is None:
+        skew = {relation_r: estimate_skew(storage, relation_r, r_index),
+                relation_s: estimate_skew(storage, relation_s, s_index)}
+    blocks = {relation_r: len(storage.disk.get(relation_r, [])), relation_s: len(storage.disk.get(relation_s, []))}
+    memory = storage.num_blocks
+    budget = max(1, memory - 2)
+    small, big = sorted(blocks, key=blocks.get)
+    two_pass = 3 * (blocks[relation_r] + blocks[relation_s])
+
+    hash_cost = two_pass
+    fan_out = max(1, memory - 1)
+    partition = blocks[small] / fan_out
+    levels = 0
+    while partition > budget and levels < 4:
+        partition /= fan_out
+        hash_cost += 2 * (blocks[relation_r] + blocks[relation_s])
+        levels += 1
+    heavy = skew[small] * blocks[small]
+    if heavy > budget:
+        probe_partition = max(blocks[big] / fan_out, skew[big] * blocks[big])
+        hash_cost += (math.ceil(heavy / budget) - 1) * math.ceil(probe_partition)
+
+    if memory < 3:
+        return {'hash': hash_cost, 'sort_merge': math.inf, 'skew': skew}
+    sort_cost = two_pass
+    runs = math.ceil(blocks[relation_r] / memory) + math.ceil(blocks[relation_s] / memory)
+    while runs > memory:
+        runs = math.ceil(runs / (memory - 1))
+        sort_cost += 2 * (blocks[relation_r] + blocks[relation_s])
+    group_small, group_big = sorted([skew[relation_r] * blocks[relation_r], skew[relation_s] * blocks[relation_s]])
+    if group_small > budget:
+        sort_cost += (math.ceil(group_small / budget) - 1) * math.ceil(group_big)
+
+    return {'hash': hash_cost, 'sort_merge': sort_cost, 'skew': skew}
+
+
+def cost_based_join(storage, join_relation={'relation_r': 1, 'relation_s': 0}, skew=None):
+    """Runs whichever of the two-pass hash join and the sort-merge join estimate_join_costs finds
+    cheaper, the hash join on a tie.
+    :return: A tuple (result, algorithm, costs), where algorithm is 'hash' or 'sort_merge'.
+    """
+    costs = estimate_join_costs(storage, join_relation, skew)
+    if costs['sort_merge'] < costs['hash']:
+        return sort_merge_join(storage, join_relation), 'sort_merge', costs
+    return list(iter_two_pass_join(storage, join_relation)), 'hash', costs
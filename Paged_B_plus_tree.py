@@ -0,0 +1,322 @@
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
+from heapq import merge
+from B_plus_tree_refactored import BPlusTree
+
+MAGIC = b'BPTPAGE1'
+NO_PAGE = -1
+FILE_HEADER = struct.Struct('<8sHcqqq')  # magic, order, key type, root page, page count, free list head
+NODE_HEADER = struct.Struct('<?Hq')  # is leaf, key count, next leaf page (next free page once freed)
+PAGE_REF = 'q'
+
+
+class BufferPool:
+    """A bounded LRU cache of pages with dirty-page write-back.
+    :param capacity: The number of pages kept in memory.
+    :param read_page: Called with a page id on a miss, returns the page object.
+    :param write_page: Called with a page id and page object when a dirty page leaves the pool.
+    """
+    def __init__(self, capacity, read_page, write_page):
+        self.capacity = capacity
+        self.read_page = read_page
+        self.write_page = write_page
+        self.pages = OrderedDict()
+        self.dirty = set()
+        self.holds = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+
+    def get(self, page_id):
+        """Returns a page, reading it from the file on a miss."""
+        page = self.pages.get(page_id)
+        if page is not None:
+            self.hits += 1
+            self.pages.move_to_end(page_id)
+            return page
+        self.misses += 1
+        page = self.read_page(page_id)
+        self.pages[page_id] = page
+        self.trim()
+        return page
+
+    def put(self, page_id, page):
+        """Admits a new or modified page as the most recently used one and marks it dirty."""
+        self.pages[page_id] = page
+        self.pages.move_to_end(page_id)
+        self.dirty.add(page_id)
+        self.trim()
+
+    def drop(self, page_id):
+        """Forgets a page without writing it back."""
+        self.pages.pop(page_id, None)
+        self.dirty.discard(page_id)
+
+    @contextmanager
+    def hold(self):
+        """Defers eviction while an update holds references to several cached pages.
+        Once the update finishes the pool is trimmed back to its capacity.
+        """
+        self.holds += 1
+        try:
+            yield
+        finally:
+            self.holds -= 1
+            self.trim()
+
+    def trim(self):
+        """Evicts least recently used pages until the pool fits its capacity."""
+        if self.holds:
+            return
+        while len(self.pages) > self.capacity:
+            page_id, page = self.pages.popitem(last=False)
+            self.evictions += 1
+            if page_id in self.dirty:
+                self._write(page_id, page)
+
+    def flush(self):
+        """Writes every dirty page back while keeping it cached."""
+        for page_id in sorted(self.dirty):
+            self._write(page_id, self.pages[page_id])
+
+    def clear(self):
+        """Forgets every cached page without writing anything."""
+        self.pages.clear()
+        self.dirty.clear()
+
+    def _write(self, page_id, page):
+        self.write_page(page_id, page)
+        self.dirty.discard(page_id)
+        self.writes += 1
+
+
+class PagedNode:
+    """A node stored in a page. Children and `next` hold page ids instead of node objects.
+        :param page_id: The page holding the node.
+        :param is_leaf: A boolean indicating if the node is a leaf node.
+        :param typecode: The array typecode of the keys.
+    """
+    __slots__ = ('page_id', 'is_leaf', 'keys', 'children', 'next')
+
+    def __init__(self, page_id, is_leaf, typecode):
+        self.page_id = page_id
+        self.is_leaf = is_leaf
+        self.keys = array(typecode)
+        self.children = []
+        self.next = None
+
+
+class PagedBPlusTree(BPlusTree):
+    """A B+ tree whose nodes live in fixed-size pages of a memory-mapped file.
+    Only the pages in the LRU buffer pool are held in memory, so an existing index opens by
+    reading its header and is then queried within a fixed memory budget. Keys are numeric,
+    as in compact mode. Updates may briefly exceed the pool by the pages along one root-to-leaf
+    path and its siblings; the pool is trimmed back once the update finishes.
+    """
+    def __init__(self, path, order=None, key_type='q', pool_size=256):
+        """Open the tree stored at path, or create it if the file does not exist yet.
+        :param path: The page file.
+        :param order: The maximum number of children a node can have, required for a new file.
+        :param key_type: The array typecode of the keys of a new file, 'q' for int64 or 'd' for float64.
+        :param pool_size: The number of pages the buffer pool keeps in memory.
+        """
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self.path = path
+        self.file = open(path, 'r+b' if exists else 'w+b')
+        if exists:
+            magic, order, key_type, root_id, page_count, free_head = FILE_HEADER.unpack(
+                self.file.read(FILE_HEADER.size))
+            if magic != MAGIC:
+                self.file.close()
+                raise ValueError(f"{path} is not a paged B+ tree file")
+            key_type = key_type.decode()
+        else:
+            if order is None:
+                self.file.close()
+                raise ValueError("order is required to create a new paged B+ tree")
+            root_id, page_count, free_head = NO_PAGE, 1, NO_PAGE
+
+        self.order = order
+        self.compact = True
+        self.key_type = key_type
+        self.root_id = root_id
+        self.page_count = page_count
+        self.free_head = free_head
+        self.children_offset = NODE_HEADER.size + order * array(key_type).itemsize
+        self.page_size = max(FILE_HEADER.size, self.children_offset + (order + 1) * array(PAGE_REF).itemsize)
+        if not exists:
+            self.file.truncate(self.page_size * 64)
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        if not exists:
+            self._write_header()
+        self.pool = BufferPool(pool_size, self._read_page, self._write_page)
+        self.Node = partial(self._allocate, False)
+        self.LeafNode = partial(self._allocate, True)
+
+    @property
+    def root(self):
+        return None if self.root_id == NO_PAGE else self.pool.get(self.root_id)
+
+    @root.setter
+    def root(self, node):
+        self.root_id = NO_PAGE if node is None else node.page_id
+
+    def insert(self, value, dense=True):
+        with self.pool.hold():
+            super().insert(value, dense)
+
+    def delete(self, key):
+        with self.pool.hold():
+            return super().delete(key)
+
+    def delete_range(self, key_start, key_end):
+        with self.pool.hold():
+            return super().delete_range(key_start, key_end)
+
+    def delete_many(self, keys):
+        with self.pool.hold():
+            return super().delete_many(keys)
+
+    def bulk_load(self, collection, dense=True, presorted=False, fill_factor=None):
+        """Rebuilds the page file bottom-up, see `BPlusTree.bulk_load`.
+        Pages of the previous tree are released instead of being left on the free list.
+        """
+        keys = list(collection) if presorted else sorted(collection)
+        if self.root_id != NO_PAGE:
+            existing = []
+            node = self._leftmost_leaf()
+            while node:
+                existing.extend(node.keys)
+                node = self._load(node.next)
+            keys = list(merge(existing, keys))
+            self.pool.clear()
+            self.root_id, self.page_count, self.free_head = NO_PAGE, 1, NO_PAGE
+        super().bulk_load(keys, dense, True, fill_factor)
+
+    def page_stats(self):
+        """Returns buffer pool counters and the size of the page file."""
+        lookups = self.pool.hits + self.pool.misses
+        return {'hits': self.pool.hits,
+                'misses': self.pool.misses,
+                'hit_ratio': self.pool.hits / lookups if lookups else 0.0,
+                'evictions': self.pool.evictions,
+                'page_writes': self.pool.writes,
+                'cached_pages': len(self.pool.pages),
+                'dirty_pages': len(self.pool.dirty),
+                'page_count': self.page_count,
+                'page_size': self.page_size}
+
+    def flush(self):
+        """Writes every dirty page and the file header to disk."""
+        self.pool.flush()
+        self._write_header()
+        self.mm.flush()
+
+    def close(self):
+        """Flushes the tree and releases the page file."""
+        self.flush()
+        self.pool.clear()
+        self.mm.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _find_path(self, value):
+        path = []
+        node = self.root
+        while not node.is_leaf:
+            index = bisect_right(node.keys, value)
+            path.append((node, index))
+            node = self.pool.get(node.children[index])
+        return path, node
+
+    def _find_node(self, node, value):
+        while not node.is_leaf:
+            node = self.pool.get(node.children[bisect_right(node.keys, value)])
+        return node
+
+    def _find_leaf(self, node, key):
+        while not node.is_leaf:
+            node = self.pool.get(node.children[bisect_left(node.keys, key)])
+        return node
+
+    def _load(self, ref):
+        return None if ref is None else self.pool.get(ref)
+
+    def _ref(self, node):
+        return node.page_id
+
+    def _dirty(self, node):
+        self.pool.put(node.page_id, node)
+
+    def _discard(self, node):
+        """Drops the node from the pool and pushes its page onto the free list."""
+        self.pool.drop(node.page_id)
+        NODE_HEADER.pack_into(self.mm, node.page_id * self.page_size, False, 0, self.free_head)
+        self.free_head = node.page_id
+
+    def _allocate(self, is_leaf):
+        """Creates a node on a page taken from the free list, or appended to the file."""
+        if self.free_head != NO_PAGE:
+            page_id = self.free_head
+            _, _, self.free_head = NODE_HEADER.unpack_from(self.mm, page_id * self.page_size)
+        else:
+            page_id = self.page_count
+            self.page_count += 1
+            if self.page_count * self.page_size > len(self.mm):
+                self._grow(self.page_count * self.page_size)
+        node = PagedNode(page_id, is_leaf, self.key_type)
+        self.pool.put(page_id, node)
+        return node
+
+    def _grow(self, min_size):
+        """Doubles the page file until it holds at least min_size bytes and maps it again."""
+        size = len(self.mm)
+        while size < min_size:
+            size *= 2
+        self.mm.flush()
+        self.mm.close()
+        self.file.truncate(size)
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+
+    def _read_page(self, page_id):
+        offset = page_id * self.page_size
+        is_leaf, num_keys, next_page = NODE_HEADER.unpack_from(self.mm, offset)
+        node = PagedNode(page_id, is_leaf, self.key_type)
+        start = offset + NODE_HEADER.size
+        node.keys.frombytes(self.mm[start:start + num_keys * node.keys.itemsize])
+        if is_leaf:
+            node.next = None if next_page == NO_PAGE else next_page
+        else:
+            children = array(PAGE_REF)
+            start = offset + self.children_offset
+            children.frombytes(self.mm[start:start + (num_keys + 1) * children.itemsize])
+            node.children = children.tolist()
+        return node
+
+    def _write_page(self, page_id, node):
+        offset = page_id * self.page_size
+        next_page = NO_PAGE if node.next is None else node.next
+        NODE_HEADER.pack_into(self.mm, offset, node.is_leaf, len(node.keys), next_page)
+        data = node.keys.tobytes()
+        start = offset + NODE_HEADER.size
+        self.mm[start:start + len(data)] = data
+        if not node.is_leaf:
+            data = array(PAGE_REF, node.children).tobytes()
+            start = offset + self.children_offset
+            self.mm[start:start + len(data)] = data
+
+    def _write_header(self):
+        FILE_HEADER.pack_into(self.mm, 0, MAGIC, self.order, self.key_type.encode(),
+                              self.root_id, self.page_count, self.free_head)
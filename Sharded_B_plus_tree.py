@@ -0,0 +1,364 @@
+import os
+from bisect import bisect_left, bisect_right
+from itertools import takewhile
+from multiprocessing import Pipe, Process
+from B_plus_tree_refactored import BPlusTree
+
+
+class _Shard:
+    """The tree of one shard together with its key count. Lives in a worker process and is driven
+    by the commands that ShardedBPlusTree sends over a pipe.
+    """
+    def __init__(self, order, compact, key_type):
+        self.tree = BPlusTree(order, compact, key_type)
+        self.size = 0
+
+    def insert(self, value, dense):
+        self.tree.insert(value, dense)
+        self.size += 1
+
+    def insert_many(self, values, dense):
+        for value in values:
+            self.tree.insert(value, dense)
+        self.size += len(values)
+
+    def bulk_load(self, values, dense):
+        self.tree.bulk_load(values, dense, presorted=True)
+        self.size += len(values)
+
+    def delete(self, key):
+        deleted = self.tree.delete(key)
+        self.size -= deleted
+        return deleted
+
+    def delete_many(self, keys):
+        deleted = self.tree.delete_many(keys)
+        self.size -= deleted
+        return deleted
+
+    def delete_range(self, key_start, key_end):
+        deleted = self.tree.delete_range(key_start, key_end)
+        self.size -= deleted
+        return deleted
+
+    def search(self, key):
+        return self.tree.search(key)
+
+    def search_many(self, keys):
+        return self.tree.search_many(keys)
+
+    def range_search(self, key_start, key_end):
+        return self.tree.range_search(key_start, key_end)
+
+    def range_search_many(self, ranges):
+        return self.tree.range_search_many(ranges)
+
+    def count(self):
+        return self.size
+
+    def key_at(self, rank):
+        """Returns the key at a position of the sorted keys."""
+        return next(self.tree.cursor(offset=rank, limit=1), None)
+
+    def extract_from(self, boundary):
+        """Removes and returns, in order, every key >= boundary."""
+        keys = list(self.tree.cursor(boundary))
+        return self._remove(keys)
+
+    def extract_below(self, boundary):
+        """Removes and returns, in order, every key < boundary."""
+        keys = list(takewhile(lambda key: key < boundary, self.tree.cursor()))
+        return self._remove(keys)
+
+    def _remove(self, keys):
+        if keys:
+            self.size -= self.tree.delete_range(keys[0], keys[-1])
+        return keys
+
+
+def _serve_shard(connection, order, compact, key_type):
+    """Worker process loop: applies each (command, args) received to a private shard and sends back
+    ('ok', result) or ('error', exception), until the command is None.
+    """
+    shard = _Shard(order, compact, key_type)
+    while True:
+        command, args = connection.recv()
+        if command is None:
+            break
+        try:
+            connection.send(('ok', getattr(shard, command)(*args)))
+        except Exception as error:
+            connection.send(('error', error))
+    connection.close()
+
+
+class ShardedBPlusTree:
+    """A B+ tree partitioned by key range over worker processes, one BPlusTree per shard.
+    Shard i holds the keys k with boundaries[i - 1] <= k < boundaries[i]. Point operations go to
+    the one shard owning the key; batches and range queries are sent to every shard involved at
+    once, so the shards work in parallel, and the ordered per-shard results are concatenated.
+    Each call costs a round trip to the worker processes, so batches are where sharding pays off.
+    """
+    def __init__(self, order, num_shards=None, boundaries=None, compact=False, key_type='q',
+                 rebalance_threshold=None):
+        """Start one worker process per shard.
+        :param order: The order of every shard's tree.
+        :param num_shards: The number of shards, the number of CPUs by default. Ignored when
+                           boundaries are given.
+        :param boundaries: The ascending keys that separate the shards. By default every key goes
+                           to the first shard until the first batch, which sets the boundaries at
+                           the key quantiles.
+        :param compact: Use compact nodes in the shards, see BPlusTree.
+        :param key_type: The array typecode of the keys in compact mode.
+        :param rebalance_threshold: Call `rebalance` with this threshold after every batch insert.
+        """
+        if boundaries is not None:
+            boundaries = list(boundaries)
+            if boundaries != sorted(boundaries):
+                raise ValueError("Shard boundaries must be in ascending order")
+            num_shards = len(boundaries) + 1
+        elif num_shards is None:
+            num_shards = os.cpu_count() or 1
+        self.order = order
+        self.boundaries = boundaries
+        self.rebalance_threshold = rebalance_threshold
+        self.connections = []
+        self.workers = []
+        for _ in range(num_shards):
+            connection, worker_end = Pipe()
+            worker = Process(target=_serve_shard, args=(worker_end, order, compact, key_type), daemon=True)
+            worker.start()
+            worker_end.close()
+            self.connections.append(connection)
+            self.workers.append(worker)
+
+    @property
+    def num_shards(self):
+        return len(self.connections)
+
+    def shard_of(self, key):
+        """Returns the index of the shard that owns a key."""
+        return 0 if self.boundaries is None else bisect_right(self.boundaries, key)
+
+    def build_tree(self, collection, dense=True, bulk=False, presorted=False):
+        """Builds the tree from a collection of values, see `BPlusTree.build_tree`."""
+        if bulk:
+            self.bulk_load(collection, dense, presorted)
+        else:
+            self.insert_many(collection, dense)
+
+    def bulk_load(self, collection, dense=True, presorted=False):
+        """Sorts the values, cuts them at the shard boundaries and bulk loads every shard in parallel.
+        Shards merge the values with the keys they already hold.
+        """
+        keys = list(collection) if presorted else sorted(collection)
+        if self.boundaries is None:
+            if not keys:
+                return
+            if self._call(0, 'count'):
+                self._call(0, 'bulk_load', keys, dense)
+                self._spread()
+                return
+            self.boundaries = [keys[len(keys) * i // self.num_shards] for i in range(1, self.num_shards)]
+        requests = []
+        start = 0
+        for shard in range(self.num_shards):
+            end = len(keys) if shard == self.num_shards - 1 else bisect_left(keys, self.boundaries[shard])
+            if end > start:
+                requests.append((shard, 'bulk_load', (keys[start:end], dense)))
+            start = end
+        self._scatter(requests)
+        self._maybe_rebalance()
+
+    def insert(self, value, dense=True):
+        self._call(self.shard_of(value), 'insert', value, dense)
+
+    def insert_many(self, values, dense=True):
+        """Inserts a batch of values, every shard inserting its share in parallel."""
+        groups = self._group(values)
+        self._scatter([(shard, 'insert_many', (group, dense)) for shard, group in groups.items()])
+        if self.boundaries is None:
+            self._spread()
+        else:
+            self._maybe_rebalance()
+
+    def delete(self, key):
+        return self._call(self.shard_of(key), 'delete', key)
+
+    def delete_many(self, keys):
+        groups = self._group(keys)
+        return sum(self._scatter([(shard, 'delete_many', (group,)) for shard, group in groups.items()]))
+
+    def delete_range(self, key_start, key_end):
+        if key_start > key_end:
+            raise ValueError(f"key_start {key_start} must be less than or equal to key_end {key_end}")
+        return sum(self._scatter([(shard, 'delete_range', (key_start, key_end))
+                                  for shard in self._shards_between(key_start, key_end)]))
+
+    def search(self, key):
+        return self._call(self.shard_of(key), 'search', key)
+
+    def search_many(self, keys):
+        """Searches for a batch of keys on all shards in parallel.
+        :return: A list of booleans, True where the key at the same position was found.
+        """
+        keys = list(keys)
+        positions = {}
+        for position, key in enumerate(keys):
+            positions.setdefault(self.shard_of(key), []).append(position)
+        requests = [(shard, 'search_many', ([keys[p] for p in group],)) for shard, group in positions.items()]
+        found = [False] * len(keys)
+        for (shard, _, _), answers in zip(requests, self._scatter(requests)):
+            for position, answer in zip(positions[shard], answers):
+                found[position] = answer
+        return found
+
+    def range_search(self, key_start, key_end):
+        """Runs the range search on every overlapping shard in parallel and concatenates the results,
+        which are already in order because shards hold disjoint, ordered key ranges.
+        """
+        if key_start > key_end:
+            raise ValueError(f"key_start {key_start} must be less than or equal to key_end {key_end}")
+        results = []
+        for keys in self._scatter([(shard, 'range_search', (key_start, key_end))
+                                   for shard in self._shards_between(key_start, key_end)]):
+            results.extend(keys)
+        return results
+
+    def range_search_many(self, ranges):
+        """Performs a batch of range searches; every shard answers the ranges overlapping it in one call."""
+        ranges = list(ranges)
+        for key_start, key_end in ranges:
+            if key_start > key_end:
+                raise ValueError(f"key_start {key_start} must be less than or equal to key_end {key_end}")
+        positions = {}
+        for position, (key_start, key_end) in enumerate(ranges):
+            for shard in self._shards_between(key_start, key_end):
+                positions.setdefault(shard, []).append(position)
+        # Shards are visited in key order so that every range collects its keys in order
+        requests = [(shard, 'range_search_many', ([ranges[p] for p in positions[shard]],))
+                    for shard in sorted(positions)]
+        results = [[] for _ in ranges]
+        for (shard, _, _), answers in zip(requests, self._scatter(requests)):
+            for position, keys in zip(positions[shard], answers):
+                results[position].extend(keys)
+        return results
+
+    def shard_sizes(self):
+        """Returns the number of keys on every shard."""
+        return self._scatter([(shard, 'count', ()) for shard in range(self.num_shards)])
+
+    def rebalance(self, threshold=1.5):
+        """Moves shard boundaries until no shard holds more than threshold times the average.
+        Every pass walks the boundaries from left to right and moves each one towards the position
+        that leaves an equal share of keys on its left, by handing keys between the two neighbouring
+        shards. Keys travel one shard per pass, so a hot shard is spread out within a few passes.
+        :return: The number of keys moved.
+        """
+        if self.boundaries is None:
+            return self._spread()
+        moved = 0
+        for _ in range(self.num_shards):
+            sizes = self.shard_sizes()
+            total = sum(sizes)
+            if max(sizes) <= threshold * total / self.num_shards:
+                break
+            moved_before = moved
+            on_left = 0
+            for shard in range(self.num_shards - 1):
+                on_left += sizes[shard]
+                target = total * (shard + 1) // self.num_shards
+                if on_left > target:
+                    excess = min(on_left - target, sizes[shard])
+                    if excess <= 0:
+                        continue
+                    boundary = self._call(shard, 'key_at', sizes[shard] - excess)
+                    keys = self._call(shard, 'extract_from', boundary)
+                    self._call(shard + 1, 'bulk_load', keys, True)
+                    count = -len(keys)
+                else:
+                    # The right shard keeps at least one key to place the boundary on
+                    deficit = min(target - on_left, sizes[shard + 1] - 1)
+                    if deficit <= 0:
+                        continue
+                    boundary = self._call(shard + 1, 'key_at', deficit)
+                    keys = self._call(shard + 1, 'extract_below', boundary)
+                    self._call(shard, 'bulk_load', keys, True)
+                    count = len(keys)
+                self.boundaries[shard] = boundary
+                sizes[shard] += count
+                sizes[shard + 1] -= count
+                on_left += count
+                moved += abs(count)
+            if moved == moved_before:
+                break
+        return moved
+
+    def close(self):
+        """Stops the worker processes; the keys they held are gone."""
+        for connection in self.connections:
+            connection.send((None, ()))
+            connection.close()
+        for worker in self.workers:
+            worker.join()
+        self.connections, self.workers = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _maybe_rebalance(self):
+        if self.rebalance_threshold is not None:
+            self.rebalance(self.rebalance_threshold)
+
+    def _spread(self):
+        """Sets the first boundaries at the key quantiles of shard 0, which holds every key until
+        then, and moves the keys above each boundary to their shard.
+        :return: The number of keys moved.
+        """
+        size = self._call(0, 'count')
+        if size == 0:
+            return 0
+        boundaries = [self._call(0, 'key_at', size * i // self.num_shards) for i in range(1, self.num_shards)]
+        moved = 0
+        for shard in range(self.num_shards - 1, 0, -1):
+            keys = self._call(0, 'extract_from', boundaries[shard - 1])
+            if keys:
+                self._call(shard, 'bulk_load', keys, True)
+                moved += len(keys)
+        self.boundaries = boundaries
+        return moved
+
+    def _shards_between(self, key_start, key_end):
+        return range(self.shard_of(key_start), self.shard_of(key_end) + 1)
+
+    def _group(self, keys):
+        """Splits keys by the shard that owns them, keeping their order within each shard."""
+        groups = {}
+        for key in keys:
+            groups.setdefault(self.shard_of(key), []).append(key)
+        return groups
+
+    def _call(self, shard, command, *args):
+        return self._scatter([(shard, command, args)])[0]
+
+    def _scatter(self, requests):
+        """Sends every (shard, command, args) request before collecting any reply, so the shards run
+        them concurrently. A shard gets at most one request per call, which keeps a shard blocked on
+        a large reply from stalling the requests still to be sent.
+        :return: The results, in the order of the requests.
+        """
+        for shard, command, args in requests:
+            self.connections[shard].send((command, args))
+        results = []
+        error = None
+        for shard, _, _ in requests:
+            status, result = self.connections[shard].recv()
+            if status == 'error' and error is None:
+                error = result
+            results.append(result)
+        if error is not None:
+            raise error
+        return results
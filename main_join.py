@@ -1,39 +1,81 @@
+import json
 import os
 import random
+from contextlib import nullcontext
 from datetime import datetime
 import pandas as pd
-from Join_based_on_hashing import StorageManager, two_pass_join, generate_relation_s, sanity_check
+from Join_based_on_hashing import (StorageManager, iter_two_pass_join, hybrid_hash_join, generate_relation_s,
+                                   sanity_check, JoinResultSink, two_pass_expected_io)
+from File_storage_manager import FileStorageManager
 
-def run_experiment(num_tuples, value_range=None, experiment_name=""):
-    """Runs a join experiment with specified parameters, logs results, and includes sanity checks."""
-    storage = StorageManager(num_blocks=15, tuples_per_block=8)
-    relation_s = generate_relation_s(5000)
-    storage.write_to_disk('relation_s', relation_s)
-
-    if value_range:
-        relation_r = [(random.choice(['info1', 'info2', 'info3']), random.randint(*value_range)) for _ in range(num_tuples)]
+def run_experiment(num_tuples, value_range=None, experiment_name="", hybrid=False, storage_dir=None,
+                   bloom_filter=False, trace=False, num_blocks=15, tuples_per_block=8, num_s_tuples=5000,
+                   visualize=True):
+    """Runs a join experiment with specified parameters, logs results, and includes sanity checks.
+    num_blocks is the memory size M, tuples_per_block the block size and num_s_tuples the size of S.
+    With visualize set, the bucket sizes are plotted after each relation is partitioned; for timings
+    across many settings use Helpers.benchmark_join_sweep, which neither plots nor logs tuples.
+    With hybrid set, the hybrid hash join runs instead and its I/O savings are logged as well.
+    With storage_dir set, relations and buckets are kept in block files in that directory instead of in RAM;
+    block files already in it are deleted first.
+    With bloom_filter set, S tuples whose key cannot match R are dropped while S is partitioned.
+    With trace set, the I/O of every join phase is traced and written to io_trace.json in the log
+    directory, with the per-bucket histograms and the comparison with the two-pass cost model.
+    """
+    if storage_dir:
+        opened = FileStorageManager(num_blocks=num_blocks, tuples_per_block=tuples_per_block, directory=storage_dir)
     else:
-        relation_r = [(random.choice(['info1', 'info2', 'info3']), b) for b, c in random.sample(relation_s, num_tuples)]
-    storage.write_to_disk('relation_r', relation_r)
+        opened = nullcontext(StorageManager(num_blocks=num_blocks, tuples_per_block=tuples_per_block))
+    with opened as storage:
+        # Block files left by an earlier run in storage_dir would be appended to and joined again
+        for key in list(storage.disk):
+            storage.remove_from_disk(key)
+        relation_s = generate_relation_s(num_s_tuples)
+        storage.write_to_disk('relation_s', relation_s)
+
+        if value_range:
+            relation_r = [(random.choice(['info1', 'info2', 'info3']), random.randint(*value_range)) for _ in range(num_tuples)]
+        else:
+            relation_r = [(random.choice(['info1', 'info2', 'info3']), b) for b, c in random.sample(relation_s, num_tuples)]
+        storage.write_to_disk('relation_r', relation_r)
+
+        base_log_dir = "logs_join_hashing"
+        timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+        run_log_dir = os.path.join(base_log_dir, timestamp, experiment_name)
+        os.makedirs(run_log_dir, exist_ok=True)
+        if trace:
+            tracer = storage.enable_tracing()
+            expected_io = two_pass_expected_io(storage)
 
-    base_log_dir = "logs_join_hashing"
-    timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
-    run_log_dir = os.path.join(base_log_dir, timestamp, experiment_name)
-    os.makedirs(run_log_dir, exist_ok=True)
+        join_log_path = os.path.join(run_log_dir, "join_experiment_log.txt")
+        with open(join_log_path, "w") as log_file:
+            log_file.write("Join Experiment Results\n")
+            log_file.write("=======================================\n")
 
-    join_log_path = os.path.join(run_log_dir, "join_experiment_log.txt")
-    with open(join_log_path, "w") as log_file:
-        log_file.write("Join Experiment Results\n")
-        log_file.write("=======================================\n")
+            io_start = storage.io_count
+            if hybrid:
+                join_result, report = hybrid_hash_join(storage, join_relation={'relation_r':1, 'relation_s': 0})
+            else:
+                join_result = iter_two_pass_join(storage, join_relation={'relation_r':1, 'relation_s': 0},
+                                                 batches=True, visualize=visualize, bloom_filter=bloom_filter)
 
-        join_result = two_pass_join(storage, join_relation={'relation_r':1, 'relation_s': 0})
-        log_file.write(f"Total results: {len(join_result)}\n")
+            # Results are streamed to the log as they are produced and checked through their digest
+            with JoinResultSink(log_file) as sink:
+                sink.write_all(join_result)
+            log_file.write(f"Total results: {sink.digest.count}\n")
 
-        for result in join_result:
-            log_file.write(f"{result}\n")
+            is_correct = sanity_check(storage, sink.digest, relation_r, relation_s, io_start)
+            log_file.write(f"Sanity check passed: {'Yes' if is_correct else 'No'}\n")
+            log_file.write(f"Disk I/O count: {storage.io_count}\n")
+            log_file.write(f"Join I/O count: {storage.io_count - io_start}\n")
+            if hybrid:
+                for name, value in report.items():
+                    log_file.write(f"{name}: {value}\n")
 
-        is_correct = sanity_check(storage, join_result, relation_r, relation_s)
-        log_file.write(f"Sanity check passed: {'Yes' if is_correct else 'No'}\n")
-        log_file.write(f"Disk I/O count: {storage.io_count}\n")
+        if trace:
+            with open(os.path.join(run_log_dir, "io_trace.json"), "w") as trace_file:
+                json.dump({'summary': tracer.summary(),
+                           'bucket_histograms': tracer.bucket_histograms(),
+                           'cost_model': tracer.compare(expected_io)}, trace_file, indent=2)
 
-    print(f"{experiment_name} completed successfully. Disk I/O count: {storage.io_count}")
\ No newline at end of file
+        print(f"{experiment_name} completed successfully. Disk I/O count: {storage.io_count}")
\ No newline at end of file